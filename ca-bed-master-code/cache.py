@@ -0,0 +1,117 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+
+logger = logging.getLogger("Response Cache")
+
+
+def hash_messages(
+    model_key: str, messages: list[dict[str, str]], **request_options
+) -> str:
+    # Options are only part of the key when given, so plain responses keep the
+    # keys they were cached under before any options existed
+    serialised = json.dumps(
+        {"model": model_key, "messages": messages, **request_options}, sort_keys=True
+    )
+    return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    value: str
+    # Usage of the request that produced the value, so callers served from the
+    # cache can still be charged for it
+    input_tokens: int
+    output_tokens: int
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM responses, persisted in SQLite so that
+    identical prompts are only paid for once across runs and experiments.
+    Identical prompts issued concurrently share a single in-flight request.
+    """
+
+    connection: sqlite3.Connection
+    lock: threading.Lock
+    in_flight: dict[str, asyncio.Task[CachedResponse]]
+
+    def __init__(self, path: Path):
+        logger.info(f"Opening response cache at '{path}'")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT,"
+            " input_tokens INTEGER NOT NULL DEFAULT 0,"
+            " output_tokens INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Caches written before usage was stored get the columns added, and
+        # their existing responses count as using no tokens
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(responses)")
+        }
+        for column in ("input_tokens", "output_tokens"):
+            if column not in columns:
+                self.connection.execute(
+                    f"ALTER TABLE responses ADD COLUMN {column}"
+                    " INTEGER NOT NULL DEFAULT 0"
+                )
+        self.connection.commit()
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def _get(self, key: str) -> CachedResponse | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, input_tokens, output_tokens FROM responses"
+                " WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def _set(self, key: str, response: CachedResponse) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, value, input_tokens, output_tokens) VALUES (?, ?, ?, ?)",
+                (key, response.value, response.input_tokens, response.output_tokens),
+            )
+            self.connection.commit()
+
+    async def cached_call(
+        self,
+        model_key: str,
+        messages: list[dict[str, str]],
+        fn: Callable[[], Awaitable[CachedResponse]],
+        **request_options,
+    ) -> CachedResponse:
+        """
+        Every caller, including those sharing an in-flight request, gets the
+        usage of the request, so each can charge its own session for it
+        """
+        key = hash_messages(model_key, messages, **request_options)
+
+        if (task := self.in_flight.get(key)) is None:
+            task = asyncio.ensure_future(self._fetch(key, fn))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        # Shielded, so a cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, key: str, fn: Callable[[], Awaitable[CachedResponse]]
+    ) -> CachedResponse:
+        # SQLite calls are blocking, so keep them off the event loop
+        if (cached := await asyncio.to_thread(self._get, key)) is not None:
+            return cached
+
+        response = await fn()
+        await asyncio.to_thread(self._set, key, response)
+        return response
@@ -12,7 +12,7 @@ from tasks.direct_prompting_task import (
 logger = logging.getLogger("Direct Prompting Method")
 
 
-async def run_task(task: DirectPromptingTask) -> RunRecord:
+async def run_task(task: DirectPromptingTask, save_tree: bool) -> RunRecord:
     """
     The direct prompting method fits into the same evaluation framework as the
     normal method. We achieve this as follows:
@@ -65,7 +65,7 @@ async def run_task(task: DirectPromptingTask) -> RunRecord:
                 # Get answer deterministically by comparing to expected answer
                 evidence_answer = (
                     "Yes"
-                    if prediction.strip().lower() == task.task_answer.strip().lower()
+                    if prediction.strip().casefold() == task.normalised_task_answer
                     else "No"
                 )
 
@@ -81,8 +81,9 @@ async def run_task(task: DirectPromptingTask) -> RunRecord:
                 raw_answer = await task.query_answerer(question)
                 evidence_answer = raw_answer.strip()
 
-                # Belief state unchanged for regular questions
-                updated_belief_state = current_node.belief_state.copy()
+                # Belief state unchanged for regular questions. Belief states
+                # are never mutated in place, so the dict can be shared
+                updated_belief_state = current_node.belief_state
 
         evidence_node = EvidenceNode(
             answer=evidence_answer,
@@ -106,7 +107,7 @@ async def run_task(task: DirectPromptingTask) -> RunRecord:
         end_time=end_time,
         final_path=final_path,
         final_belief_state=current_node.belief_state,
-        serialised_tree=serialise_evidence_node(root),
+        serialised_tree=serialise_evidence_node(root) if save_tree else None,
     )
 
 
@@ -120,13 +121,12 @@ def calculate_posterior(
     posterior = prior_belief_state.copy()
     posterior[prediction] = posterior.get(prediction, 0) + prediction_weight
 
-    # Normalise to ensure probabilities sum to 1
+    # Normalise to ensure probabilities sum to 1, in place rather than into
+    # a second dict
     total_probability = sum(posterior.values())
     assert total_probability > 0
-    posterior = {
-        hypothesis: probability / total_probability
-        for hypothesis, probability in posterior.items()
-    }
+    for hypothesis, probability in posterior.items():
+        posterior[hypothesis] = probability / total_probability
     return posterior
 
 
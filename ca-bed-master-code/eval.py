@@ -1,11 +1,10 @@
 from datetime import datetime, timedelta
+import heapq
 from pathlib import Path
-from typing import TypedDict
+from typing import TypedDict, cast
 
 from history import RunRecord
 
-import json
-
 
 class RunEval(TypedDict):
     top1: bool
@@ -33,13 +32,13 @@ class GroupEval(TypedDict):
 
 
 def get_run_eval(run_history: RunRecord) -> RunEval:
-    guesses = sorted(
+    # Same ordering (and tie-breaking) as a full descending sort, without the sort
+    top3_guesses = heapq.nlargest(
+        3,
         run_history.final_belief_state.keys(),
         key=run_history.final_belief_state.__getitem__,
-        reverse=True,
     )
-    top3_guesses = guesses[:3]
-    top1_guesses = guesses[:1]
+    top1_guesses = top3_guesses[:1]
 
     top1 = run_history.expected_answer in top1_guesses
     top3 = run_history.expected_answer in top3_guesses
@@ -59,53 +58,35 @@ def get_run_eval(run_history: RunRecord) -> RunEval:
 
 
 def get_group_eval(run_evals: list[RunEval]) -> GroupEval:
-    top1 = sum(run_eval["top1"] for run_eval in run_evals) / len(run_evals)
-    top3 = sum(run_eval["top3"] for run_eval in run_evals) / len(run_evals)
-    mean_conversation_length = sum(
-        run_eval["conversation_length"] for run_eval in run_evals
-    ) / len(run_evals)
-    conv_length_successful = [
-        run_eval["conversation_length"] for run_eval in run_evals if run_eval["top1"]
-    ]
-    mean_conversation_length_in_successful_cases = sum(conv_length_successful) / len(
-        conv_length_successful
-    )
-
-    questioner_input_tokens = sum(
-        run_eval["questioner_input_tokens"] for run_eval in run_evals
-    )
-    questioner_output_tokens = sum(
-        run_eval["questioner_output_tokens"] for run_eval in run_evals
-    )
-    answerer_input_tokens = sum(
-        run_eval["answerer_input_tokens"] for run_eval in run_evals
-    )
-    answerer_output_tokens = sum(
-        run_eval["answerer_output_tokens"] for run_eval in run_evals
-    )
+    # Imported here, like the script's own dependencies, so importing this
+    # module doesn't need polars
+    import polars as pl
 
-    duration = max(run_eval["end_time"] for run_eval in run_evals) - min(
-        run_eval["start_time"] for run_eval in run_evals
+    df = pl.DataFrame(run_evals)
+    aggregates = df.select(
+        pl.len().alias("num_runs"),
+        pl.col("top1").mean(),
+        pl.col("top3").mean(),
+        (pl.col("end_time").max() - pl.col("start_time").min()).alias("duration"),
+        pl.col("conversation_length").mean().alias("mean_conversation_length"),
+        pl.col("conversation_length")
+        .filter(pl.col("top1"))
+        .mean()
+        .alias("mean_conversation_length_in_successful_cases"),
+        pl.col("questioner_input_tokens").sum(),
+        pl.col("questioner_output_tokens").sum(),
+        pl.col("answerer_input_tokens").sum(),
+        pl.col("answerer_output_tokens").sum(),
     )
-
-    return {
-        "num_runs": len(run_evals),
-        "top1": top1,
-        "top3": top3,
-        "duration": duration,
-        "mean_conversation_length": mean_conversation_length,
-        "mean_conversation_length_in_successful_cases": mean_conversation_length_in_successful_cases,
-        "questioner_input_tokens": questioner_input_tokens,
-        "questioner_output_tokens": questioner_output_tokens,
-        "answerer_input_tokens": answerer_input_tokens,
-        "answerer_output_tokens": answerer_output_tokens,
-    }
+    return cast(GroupEval, aggregates.row(0, named=True))
 
 
 if __name__ == "__main__":
     import argparse
+    from concurrent.futures import ThreadPoolExecutor
     from pathlib import Path
     from history import deserialise_run_record
+    import orjson
     from tqdm import tqdm
     import polars as pl
 
@@ -150,43 +131,50 @@ if __name__ == "__main__":
     answerer_input_price: float = args.answerer_input_price
     answerer_output_price: float = args.answerer_output_price
 
+    def load_run_eval(path: Path) -> RunEval:
+        # Reduce each record as soon as it is read, so full records (and their
+        # trees) never have to be held in memory together
+        return get_run_eval(deserialise_run_record(orjson.loads(path.read_bytes())))
+
     results = []
-    for dir_path in paths:
-        run_evals: list[RunEval] = []
-        for i, path in enumerate(
-            tqdm(dir_path.rglob("*run.json"), desc=f"Loading {dir_path.name}")
-        ):
-            with path.open("r", encoding="utf-8") as f:
-                run_record = deserialise_run_record(json.load(f))
-            run_evals.append(get_run_eval(run_record))
-
-        group_eval = get_group_eval(run_evals)
-        cost = {
-            "questioner_input_price": (questioner_input_price / 1_000_000)
-            * group_eval["questioner_input_tokens"],
-            "questioner_output_price": (questioner_output_price / 1_000_000)
-            * group_eval["questioner_output_tokens"],
-            "answerer_input_price": (answerer_input_price / 1_000_000)
-            * group_eval["answerer_input_tokens"],
-            "answerer_output_price": (answerer_output_price / 1_000_000)
-            * group_eval["answerer_output_tokens"],
-        }
-        total_cost = sum(cost.values())
-
-        results.append(
-            {
-                "experiment": dir_path.as_posix().split("/")[-1],
-                "num_runs": group_eval["num_runs"],
-                "top1": group_eval["top1"],
-                "top3": group_eval["top3"],
-                "mean_conversation_length": group_eval["mean_conversation_length"],
-                "mean_conversation_length_in_successful_cases": group_eval[
-                    "mean_conversation_length_in_successful_cases"
-                ],
-                "total_cost": total_cost,
-                "duration": group_eval["duration"],
+    with ThreadPoolExecutor() as executor:
+        for dir_path in paths:
+            run_paths = list(dir_path.rglob("*run.json"))
+            run_evals: list[RunEval] = list(
+                tqdm(
+                    executor.map(load_run_eval, run_paths),
+                    total=len(run_paths),
+                    desc=f"Loading {dir_path.name}",
+                )
+            )
+
+            group_eval = get_group_eval(run_evals)
+            cost = {
+                "questioner_input_price": (questioner_input_price / 1_000_000)
+                * group_eval["questioner_input_tokens"],
+                "questioner_output_price": (questioner_output_price / 1_000_000)
+                * group_eval["questioner_output_tokens"],
+                "answerer_input_price": (answerer_input_price / 1_000_000)
+                * group_eval["answerer_input_tokens"],
+                "answerer_output_price": (answerer_output_price / 1_000_000)
+                * group_eval["answerer_output_tokens"],
             }
-        )
+            total_cost = sum(cost.values())
+
+            results.append(
+                {
+                    "experiment": dir_path.as_posix().split("/")[-1],
+                    "num_runs": group_eval["num_runs"],
+                    "top1": group_eval["top1"],
+                    "top3": group_eval["top3"],
+                    "mean_conversation_length": group_eval["mean_conversation_length"],
+                    "mean_conversation_length_in_successful_cases": group_eval[
+                        "mean_conversation_length_in_successful_cases"
+                    ],
+                    "total_cost": total_cost,
+                    "duration": group_eval["duration"],
+                }
+            )
 
     df = pl.DataFrame(results)
 
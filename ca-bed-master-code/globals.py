@@ -1,7 +1,16 @@
-from sentence_transformers import SentenceTransformer
+from functools import cache
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
-SENTENCE_TRANSFORMER = SentenceTransformer(
-    "quora-distilbert-multilingual",
-    backend="onnx",
-)
+
+@cache
+def get_sentence_transformer() -> "SentenceTransformer":
+    # Imported lazily, so runs that never embed anything skip loading torch/ONNX
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(
+        "quora-distilbert-multilingual",
+        backend="onnx",
+    )
@@ -1,8 +1,12 @@
+import asyncio
 from dataclasses import dataclass
 from datetime import datetime
 import json
 from pathlib import Path
-from typing import Literal, TypedDict
+from typing import Literal, TypedDict, cast
+
+import orjson
+
 from models import LLMRequestSession
 from node import EvidenceNode, QuestionNode
 from question_clustering import Cluster, QuestionClustering
@@ -24,57 +28,96 @@ class SerialisedEvidenceNode(TypedDict):
     children: list["SerialisedQuestionNode"]
 
 
+type Node = EvidenceNode | QuestionNode
+type SerialisedNode = SerialisedEvidenceNode | SerialisedQuestionNode
+
+
+def _serialise_node_fields(node: Node) -> SerialisedNode:
+    match node:
+        case EvidenceNode():
+            return {
+                "type": "evidence",
+                "answer": node.answer,
+                "belief_state": node.belief_state,
+                "marginal_likelihood": node.marginal_likelihood,
+                "children": [],
+            }
+        case QuestionNode():
+            return {
+                "type": "question",
+                "question": node.question,
+                "possible_answers": node.possible_answers,
+                "children": [],
+            }
+
+
+def _serialise_tree(root: Node) -> SerialisedNode:
+    # Walk the tree with an explicit stack rather than recursion, so deep
+    # conversations can't hit the recursion limit
+    serialised_root = _serialise_node_fields(root)
+    stack: list[tuple[Node, SerialisedNode]] = [(root, serialised_root)]
+    while stack:
+        node, serialised_node = stack.pop()
+        for child in node.children:
+            serialised_child = _serialise_node_fields(child)
+            serialised_node["children"].append(serialised_child)  # type: ignore
+            stack.append((child, serialised_child))
+
+    return serialised_root
+
+
 def serialise_question_node(node: QuestionNode) -> SerialisedQuestionNode:
-    return {
-        "type": "question",
-        "question": node.question,
-        "possible_answers": node.possible_answers,
-        "children": [serialise_evidence_node(child) for child in node.children],
-    }
+    return cast(SerialisedQuestionNode, _serialise_tree(node))
 
 
 def serialise_evidence_node(node: EvidenceNode) -> SerialisedEvidenceNode:
-    return {
-        "type": "evidence",
-        "answer": node.answer,
-        "belief_state": node.belief_state,
-        "marginal_likelihood": node.marginal_likelihood,
-        "children": [serialise_question_node(child) for child in node.children],
-    }
+    return cast(SerialisedEvidenceNode, _serialise_tree(node))
 
 
-def deserialise_question_node(
-    node: SerialisedQuestionNode, parent: EvidenceNode
-) -> QuestionNode:
-    deserialised_node = QuestionNode(
+def _deserialise_node_fields(node: SerialisedNode, parent: Node | None) -> Node:
+    if node["type"] == "evidence":
+        return EvidenceNode(
+            answer=node["answer"],
+            belief_state=node["belief_state"],
+            marginal_likelihood=node["marginal_likelihood"],
+            parent=cast(QuestionNode | None, parent),
+        )
+
+    return QuestionNode(
         question=node["question"],
         possible_answers=node["possible_answers"],
-        parent=parent,
+        parent=cast(EvidenceNode, parent),
     )
-    deserialised_node.children = [
-        deserialise_evidence_node(child, parent=deserialised_node)
-        for child in node["children"]
-    ]
-    return deserialised_node
+
+
+def _deserialise_tree(root: SerialisedNode, parent: Node | None) -> Node:
+    # Parents are built before their children, so each node can be linked up
+    # (and work out its depth) as soon as it is created
+    deserialised_root = _deserialise_node_fields(root, parent)
+    stack: list[tuple[SerialisedNode, Node]] = [(root, deserialised_root)]
+    while stack:
+        node, deserialised_node = stack.pop()
+        for child in node["children"]:
+            deserialised_child = _deserialise_node_fields(child, deserialised_node)
+            deserialised_node.children.append(deserialised_child)  # type: ignore
+            stack.append((child, deserialised_child))
+
+    return deserialised_root
+
+
+def deserialise_question_node(
+    node: SerialisedQuestionNode, parent: EvidenceNode
+) -> QuestionNode:
+    return cast(QuestionNode, _deserialise_tree(node, parent))
 
 
 def deserialise_evidence_node(
     node: SerialisedEvidenceNode, parent: QuestionNode | None = None
 ) -> EvidenceNode:
-    deserialised_node = EvidenceNode(
-        answer=node["answer"],
-        belief_state=node["belief_state"],
-        marginal_likelihood=node["marginal_likelihood"],
-        parent=parent,
-    )
-    deserialised_node.children = [
-        deserialise_question_node(child, parent=deserialised_node)
-        for child in node["children"]
-    ]
-    return deserialised_node
+    return cast(EvidenceNode, _deserialise_tree(node, parent))
 
 
-@dataclass
+@dataclass(slots=True)
 class RunRecord:
     task_info: str
     questioner_session: LLMRequestSession
@@ -101,8 +144,8 @@ def serialise_run_record(run_record: RunRecord) -> dict:
             "total_input_tokens": run_record.answerer_session.total_input_tokens,
             "total_output_tokens": run_record.answerer_session.total_output_tokens,
         },
-        "start_time": run_record.start_time.isoformat(),
-        "end_time": run_record.end_time.isoformat(),
+        "start_time": run_record.start_time,
+        "end_time": run_record.end_time,
         "final_path": run_record.final_path,
         "final_belief_state": run_record.final_belief_state,
         "serialised_tree": run_record.serialised_tree,
@@ -134,7 +177,7 @@ def deserialise_run_record(
     )
 
 
-def save_question_clustering(
+async def save_question_clustering(
     clustering: QuestionClustering, json_path: Path, voyager_path: Path
 ) -> None:
     serialised_clusters = {
@@ -147,10 +190,14 @@ def save_question_clustering(
 
     json_cluster = {"clusters": serialised_clusters, "threshold": clustering.threshold}
 
-    with json_path.open("w", encoding="utf-8") as f:
-        json.dump(json_cluster, f)
-
-    clustering.index.save(str(voyager_path))
+    # Snapshot on the event loop, as other runs may still be growing a shared
+    # clustering, and only hand the file writes to worker threads
+    json_bytes = orjson.dumps(json_cluster, option=orjson.OPT_NON_STR_KEYS)
+    index_bytes = clustering.index.as_bytes()
+    await asyncio.gather(
+        asyncio.to_thread(json_path.write_bytes, json_bytes),
+        asyncio.to_thread(voyager_path.write_bytes, index_bytes),
+    )
 
 
 def load_question_clustering(json_path: Path, voyager_path: Path) -> QuestionClustering:
@@ -166,7 +213,7 @@ def load_question_clustering(json_path: Path, voyager_path: Path) -> QuestionClu
             questions=cluster_dict["questions"],
             likelihoods=cluster_dict["likelihoods"],
         )
-        clustering.clusters[key] = cluster
+        clustering.clusters[int(key)] = cluster
 
     with voyager_path.open("rb") as f:
         clustering.index = Index.load(f)
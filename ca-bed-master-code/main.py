@@ -1,16 +1,26 @@
 import argparse
 import asyncio
-import json
 import logging
+from collections.abc import Callable
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import cast
 
+import orjson
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from cache import ResponseCache
 import direct_prompting_method
 from history import save_question_clustering, serialise_run_record
 import method
 from models import LLMRequestSession
 from question_clustering import QuestionClustering
+from semantic_cache import SemanticAnswerCache
 from tasks.detective_cases.data import load_all_data as load_detective_data
 from tasks.detective_cases.uot import DetectiveCasesUoT
 from tasks.detective_cases.bayesian import DetectiveCasesBayesian
@@ -32,9 +42,16 @@ logger = logging.getLogger("Main")
 type Task = DirectPromptingTask | TreeTask
 
 
-def create_task_instance(task_name: str, item, args) -> Task:
-    q_session = LLMRequestSession(args.questioner_model)
-    a_session = LLMRequestSession(args.answerer_model)
+def create_task_instance(
+    task_name: str, item, args, response_cache: ResponseCache | None
+) -> Task:
+    q_session = LLMRequestSession(args.questioner_model, response_cache=response_cache)
+    a_session = LLMRequestSession(
+        args.answerer_model,
+        response_cache=response_cache,
+        max_response_tokens=args.answerer_max_tokens,
+        temperature=args.answerer_temperature,
+    )
 
     # === DETECTIVE CASES ===
     if task_name == "detective_direct":
@@ -115,6 +132,7 @@ def create_task_instance(task_name: str, item, args) -> Task:
             confidence_threshold=args.confidence_threshold,
             estimator_confidence=args.estimator_confidence,
             hypothesis_space=COMMON,
+            likelihood_batch_size=args.likelihood_batch_size,
         )
 
     elif task_name == "twentyq_bayesian_multi":
@@ -133,16 +151,32 @@ def create_task_instance(task_name: str, item, args) -> Task:
     raise ValueError(f"Unknown task: {task_name}")
 
 
+def build_task(item, args, response_cache: ResponseCache | None) -> Task:
+    task = create_task_instance(args.task, item, args, response_cache)
+    if args.semantic_cache_threshold is not None:
+        task.semantic_cache = SemanticAnswerCache(args.semantic_cache_threshold)
+    return task
+
+
 async def main(args: argparse.Namespace) -> None:
+    # Much of the tree expansion finds its likelihoods already cached and
+    # finishes without suspending, so run new tasks eagerly up to their first await
+    asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     if args.task.startswith("detective_"):
         dataset = load_detective_data()
     else:
         dataset = COMMON
 
-    shared_clustering = QuestionClustering(args.clustering_threshold)
+    shared_clustering = QuestionClustering(
+        args.clustering_threshold, args.quantise_clustering_index
+    )
+    response_cache = ResponseCache(args.cache_path) if args.cache_path else None
 
-    tasks = [
-        create_task_instance(args.task, item, args)
+    # Tasks are only built once their run starts, so sessions and caches for
+    # queued runs don't all have to exist up front
+    task_factories = [
+        partial(build_task, item, args, response_cache)
         for item in dataset[args.start_idx : args.end_idx]
     ]
 
@@ -156,69 +190,116 @@ async def main(args: argparse.Namespace) -> None:
     )
 
     if args.task.endswith("direct"):
-        tasks = cast(list[DirectPromptingTask], tasks)
+        direct_factories = cast(list[Callable[[], DirectPromptingTask]], task_factories)
         await asyncio.gather(
             *[
-                run_direct_prompting_task(i, task, output_dir, semaphore)
-                for i, task in enumerate(tasks, start=args.start_idx)
+                run_direct_prompting_task(
+                    i, create_task, output_dir, semaphore, args.save_tree
+                )
+                for i, create_task in enumerate(direct_factories, start=args.start_idx)
             ]
         )
     else:
-        tasks = cast(list[TreeTask], tasks)
-        await asyncio.gather(
-            *[
-                run_tree_based_task(
-                    idx=i,
-                    task=task,
-                    output_dir=output_dir,
-                    semaphore=semaphore,
-                    sharpness_constant=args.sharpness_constant,
-                    min_probability=args.min_probability,
-                    question_clustering=(
-                        shared_clustering
-                        if args.shared_cluster
-                        else QuestionClustering(args.clustering_threshold)
-                    ),
-                )
-                for i, task in enumerate(tasks, start=args.start_idx)
-            ]
+        tree_factories = cast(list[Callable[[], TreeTask]], task_factories)
+        # Like the tasks, each run's own clustering is only built once it starts
+        create_clustering: Callable[[], QuestionClustering] = (
+            (lambda: shared_clustering)
+            if args.shared_cluster
+            else partial(
+                QuestionClustering,
+                args.clustering_threshold,
+                args.quantise_clustering_index,
+            )
         )
 
+        # The shared clustering keeps growing until the last run finishes, so
+        # it is written once at the end rather than re-written after every run.
+        # That also happens if a run fails or the experiment is interrupted, so
+        # the likelihoods gathered so far aren't lost
+        try:
+            await asyncio.gather(
+                *[
+                    run_tree_based_task(
+                        idx=i,
+                        create_task=create_task,
+                        output_dir=output_dir,
+                        semaphore=semaphore,
+                        sharpness_constant=args.sharpness_constant,
+                        min_probability=args.min_probability,
+                        min_branch_probability=args.min_branch_probability,
+                        save_tree=args.save_tree,
+                        create_clustering=create_clustering,
+                        save_clustering=not args.shared_cluster,
+                    )
+                    for i, create_task in enumerate(
+                        tree_factories, start=args.start_idx
+                    )
+                ]
+            )
+        finally:
+            if args.shared_cluster:
+                await save_question_clustering(
+                    shared_clustering,
+                    output_dir / "shared_cluster.json",
+                    output_dir / "shared_cluster.voy",
+                )
+
     logger.info("All runs completed successfully!")
 
 
 async def run_tree_based_task(
     idx: int,
-    task: TreeTask,
+    create_task: Callable[[], TreeTask],
     output_dir: Path,
     semaphore: asyncio.Semaphore,
     sharpness_constant: float,
     min_probability: float,
-    question_clustering: QuestionClustering,
+    min_branch_probability: float,
+    save_tree: bool,
+    create_clustering: Callable[[], QuestionClustering],
+    save_clustering: bool,
 ) -> None:
     async with semaphore:
+        task = create_task()
+        question_clustering = create_clustering()
         run_record = await method.run_task(
-            task, question_clustering, sharpness_constant, min_probability
+            task,
+            question_clustering,
+            sharpness_constant,
+            min_probability,
+            min_branch_probability,
+            save_tree,
         )
 
-        save_question_clustering(
+    if save_clustering:
+        await save_question_clustering(
             question_clustering,
             output_dir / f"{idx}_cluster.json",
             output_dir / f"{idx}_cluster.voy",
         )
-        with (output_dir / f"{idx}_run.json").open("w", encoding="utf-8") as f:
-            json.dump(serialise_run_record(run_record), f)
-        logger.info(f"[{idx}] Completed run.")
+    await asyncio.to_thread(
+        (output_dir / f"{idx}_run.json").write_bytes,
+        orjson.dumps(serialise_run_record(run_record)),
+    )
+    logger.info(f"[{idx}] Completed run.")
 
 
 async def run_direct_prompting_task(
-    idx: int, task: DirectPromptingTask, output_dir: Path, semaphore: asyncio.Semaphore
+    idx: int,
+    create_task: Callable[[], DirectPromptingTask],
+    output_dir: Path,
+    semaphore: asyncio.Semaphore,
+    save_tree: bool,
 ) -> None:
     async with semaphore:
-        run_record = await direct_prompting_method.run_task(task)
-        with (output_dir / f"{idx}_run.json").open("w", encoding="utf-8") as f:
-            json.dump(serialise_run_record(run_record), f)
-        logger.info(f"[{idx}] Completed direct run.")
+        task = create_task()
+        run_record = await direct_prompting_method.run_task(task, save_tree)
+
+    await asyncio.to_thread(
+        (output_dir / f"{idx}_run.json").write_bytes,
+        orjson.dumps(serialise_run_record(run_record)),
+    )
+    logger.info(f"[{idx}] Completed direct run.")
 
 
 def parse_args() -> argparse.Namespace:
@@ -231,11 +312,14 @@ def parse_args() -> argparse.Namespace:
     def add_shared_args(p):
         p.add_argument("--questioner_model", default="deepseek-chat")
         p.add_argument("--answerer_model", default="deepseek-reasoner")
+        p.add_argument("--answerer_max_tokens", type=int, default=None)
+        p.add_argument("--answerer_temperature", type=float, default=1.0)
         p.add_argument("--start_idx", type=int, default=0)
         p.add_argument("--end_idx", type=int, default=10)
         p.add_argument("--conversation_depth", type=int, default=20)
         p.add_argument("--max_concurrent", type=int, default=6)
         p.add_argument("--clustering_threshold", type=float, default=1.0)
+        p.add_argument("--quantise_clustering_index", action="store_true")
         p.add_argument("--shared_cluster", action="store_true")
         p.add_argument(
             "--output_dir",
@@ -243,6 +327,9 @@ def parse_args() -> argparse.Namespace:
         )
         p.add_argument("--sharpness_constant", type=float, default=0.4)
         p.add_argument("--min_probability", type=float, default=1 / 25_000)
+        p.add_argument("--cache_path", type=Path, default=None)
+        p.add_argument("--semantic_cache_threshold", type=float, default=None)
+        p.add_argument("--save_tree", action="store_true")
 
     # ========== TREE ARGS ==========
     def add_tree_args(p):
@@ -250,6 +337,7 @@ def parse_args() -> argparse.Namespace:
         p.add_argument("--max_lookahead_depth", type=int, default=3)
         p.add_argument("--confidence_threshold", type=float, default=0.8)
         p.add_argument("--estimator_confidence", type=float, default=0.7)
+        p.add_argument("--min_branch_probability", type=float, default=0.0)
 
     # ========== DETECTIVE CASES ==========
     for name in [
@@ -274,6 +362,8 @@ def parse_args() -> argparse.Namespace:
         add_shared_args(p)
         if name != "twentyq_direct":
             add_tree_args(p)
+        if name == "twentyq_bayesian":
+            p.add_argument("--likelihood_batch_size", type=int, default=1)
 
     return parser.parse_args()
 
@@ -292,4 +382,4 @@ if __name__ == "__main__":
         force=True,
     )
 
-    asyncio.run(main(args))
+    asyncio.run(main(args), loop_factory=uvloop.new_event_loop if uvloop else None)
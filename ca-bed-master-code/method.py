@@ -16,6 +16,8 @@ async def run_task(
     question_clustering: QuestionClustering,
     sharpness_constant: float,
     min_probability: float,
+    min_branch_probability: float,
+    save_tree: bool,
 ) -> RunRecord:
     start_time = datetime.now()
     final_path: list[str] = []
@@ -30,7 +32,12 @@ async def run_task(
     try:
         while not is_terminal(current_node, task):
             await expand_evidence(
-                current_node, 0, task, question_clustering, min_probability
+                current_node,
+                0,
+                task,
+                question_clustering,
+                min_probability,
+                min_branch_probability,
             )
 
             best_question_node = max(
@@ -63,7 +70,7 @@ async def run_task(
         end_time=end_time,
         final_path=final_path,
         final_belief_state=current_node.belief_state,
-        serialised_tree=serialise_evidence_node(root),
+        serialised_tree=serialise_evidence_node(root) if save_tree else None,
     )
 
 
@@ -73,10 +80,16 @@ async def expand_evidence(
     task: TreeTask,
     question_clustering: QuestionClustering,
     min_probability: float,
+    min_branch_probability: float,
 ) -> None:
     if is_terminal(current_node, task) or current_depth >= task.max_lookahead_depth:
         return
 
+    # Unlikely answers contribute little to the expected reward of their
+    # question, so don't spend further lookahead on them
+    if current_depth > 0 and current_node.marginal_likelihood < min_branch_probability:
+        return
+
     if not current_node.children:
         new_questions = await task.create_questions(current_node)
         new_question_nodes = [
@@ -84,11 +97,17 @@ async def expand_evidence(
             for q, answers in new_questions.items()
         ]
         current_node.children.extend(new_question_nodes)
+        question_clustering.encode_questions(list(new_questions))
 
     await asyncio.gather(
         *[
             expand_questions(
-                child, current_depth, task, question_clustering, min_probability
+                child,
+                current_depth,
+                task,
+                question_clustering,
+                min_probability,
+                min_branch_probability,
             )
             for child in current_node.children
         ]
@@ -101,25 +120,36 @@ async def expand_questions(
     task: TreeTask,
     question_clustering: QuestionClustering,
     min_probability: float,
+    min_branch_probability: float,
 ) -> None:
     if not current_node.children:
         cluster = question_clustering.get_cluster(current_node.question)
 
-        async with cluster.lock:
-            if answers := cluster.get_answers():
-                current_node.possible_answers = answers
-            else:
-                answers = current_node.possible_answers
+        answers = current_node.possible_answers = cluster.claim_answers(
+            current_node.possible_answers
+        )
 
-            missing_hypotheses = set(current_node.parent.belief_state.keys()) - set(
-                cluster.get_hypotheses()
+        # Only request the likelihoods nobody else is fetching, and wait on
+        # the requests in flight for the rest, so siblings needing other
+        # hypotheses of the same cluster are never held up. A request waited on
+        # may fail or miss some hypotheses, so check again for any still missing
+        while True:
+            requested, requested_event, in_flight = cluster.claim_hypotheses(
+                current_node.parent.belief_state
             )
-
-            if missing_hypotheses:
-                new_likelihoods = await task.get_likelihoods(
-                    current_node.question, answers, list(missing_hypotheses)
-                )
-                cluster.likelihoods.update(new_likelihoods)
+            try:
+                if requested:
+                    new_likelihoods = await task.get_likelihoods(
+                        current_node.question, answers, requested
+                    )
+                    cluster.add_likelihoods(new_likelihoods)
+            finally:
+                cluster.release_hypotheses(requested, requested_event)
+
+            if not in_flight:
+                break
+            for event in in_flight:
+                await event.wait()
 
         for answer in answers:
             likelihoods = cluster.get_likelihoods_for_answer(answer)
@@ -141,7 +171,12 @@ async def expand_questions(
     await asyncio.gather(
         *[
             expand_evidence(
-                child, current_depth + 1, task, question_clustering, min_probability
+                child,
+                current_depth + 1,
+                task,
+                question_clustering,
+                min_probability,
+                min_branch_probability,
             )
             for child in current_node.children
         ]
@@ -155,28 +190,27 @@ def calculate_posterior(
     uniform_likelihood: float,
     estimator_confidence: float,
 ) -> tuple[dict[str, float], float]:
+    # Hoisted out of the comprehension, as it's the same for every hypothesis
+    uniform_term = uniform_likelihood * (1 - estimator_confidence)
     all_posteriors = {
         h: p
-        * (
-            likelihoods.get(h, uniform_likelihood) * estimator_confidence
-            + uniform_likelihood * (1 - estimator_confidence)
-        )
+        * (likelihoods.get(h, uniform_likelihood) * estimator_confidence + uniform_term)
         for h, p in prior.items()
     }
 
     # Warn for missing likelihoods
-    for h in prior:
-        if h not in likelihoods:
-            logger.warning(
-                f"'{h}' not found in likelihoods ({list(likelihoods.keys())})! Defaulting to {uniform_likelihood}..."
-            )
-
-    unnormalised = {h: p for h, p in all_posteriors.items() if p >= min_probability}
+    if missing := prior.keys() - likelihoods.keys():
+        for h in prior:
+            if h in missing:
+                logger.warning(
+                    f"'{h}' not found in likelihoods ({list(likelihoods.keys())})! Defaulting to {uniform_likelihood}..."
+                )
 
     # If filtering empties the belief state, use the non-filtered values
     # This indicates a very unlikely path in the tree, so we don't save much by filtering
-    if not unnormalised:
-        unnormalised = {h: p for h, p in all_posteriors.items()}
+    unnormalised = {
+        h: p for h, p in all_posteriors.items() if p >= min_probability
+    } or all_posteriors
 
     marginal = sum(unnormalised.values())
     normalised = {h: p / marginal for h, p in unnormalised.items()}
@@ -184,6 +218,7 @@ def calculate_posterior(
 
 
 def is_terminal(node: EvidenceNode, task: TreeTask) -> bool:
-    return get_conversation_depth(node) >= task.max_conversation_depth or any(
-        prob >= task.confidence_threshold for prob in node.belief_state.values()
+    return (
+        get_conversation_depth(node) >= task.max_conversation_depth
+        or max(node.belief_state.values(), default=0.0) >= task.confidence_threshold
     )
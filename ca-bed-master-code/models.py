@@ -1,21 +1,60 @@
+import asyncio
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
+import logging
 import os
+import random
 
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
-from openai.types.chat.chat_completion_token_logprob import TopLogprob
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_random_exponential,
+import httpx
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    NOT_GIVEN,
+    InternalServerError,
+    RateLimitError,
 )
+from openai.types.chat.chat_completion_token_logprob import (
+    ChatCompletionTokenLogprob,
+    TopLogprob,
+)
+from openai.types.completion_usage import CompletionUsage
+import orjson
+
+from cache import CachedResponse, ResponseCache
+
+logger = logging.getLogger("Models")
 
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_KEY")
 api_base_url = "https://api.deepseek.com"
 
-CLIENT = AsyncOpenAI(api_key=api_key, base_url=api_base_url)
+llm_concurrency = int(os.getenv("LLM_CONCURRENCY", "16"))
+
+# HTTP/2 multiplexes the concurrent requests over a few connections, and the
+# pool keeps one connection alive per request slot so none are re-established
+CLIENT = AsyncOpenAI(
+    api_key=api_key,
+    base_url=api_base_url,
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=llm_concurrency,
+            max_keepalive_connections=llm_concurrency,
+        ),
+    ),
+)
+
+# Caps in-flight requests across all runs. Taken inside the retried functions,
+# so a request backing off after a failure doesn't hold on to its slot
+LLM_SEMAPHORE = asyncio.Semaphore(llm_concurrency)
+
+MAX_ATTEMPTS = 5
+# Errors that may succeed on another attempt. Anything else (e.g. a bad API
+# key or a malformed request) fails the same way every time
+TRANSIENT_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
 
 
 @dataclass(slots=True)
@@ -23,48 +62,151 @@ class LLMRequestSession:
     model_key: str
     total_input_tokens: int = 0
     total_output_tokens: int = 0
+    response_cache: ResponseCache | None = None
+    # Caps the length of plain responses. Left unset by default, as reasoning
+    # models count their chain of thought against the cap
+    max_response_tokens: int | None = None
+    # Sampling temperature of plain responses
+    temperature: float = 1.0
+
+
+def _add_usage(
+    session: LLMRequestSession, input_tokens: int, output_tokens: int
+) -> None:
+    session.total_input_tokens += input_tokens
+    session.total_output_tokens += output_tokens
+
+
+async def _with_retry[T](request: Callable[[], Awaitable[T]]) -> T:
+    """Retries transient failures with randomised exponential backoff"""
+    for attempt in range(1, MAX_ATTEMPTS):
+        try:
+            return await request()
+        except TRANSIENT_ERRORS as e:
+            backoff = random.uniform(3, min(3 * 2**attempt, 60))
+            logger.warning(
+                f"Attempt {attempt} failed with '{e}', retrying in {backoff:.1f}s..."
+            )
+            await asyncio.sleep(backoff)
+
+    return await request()
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=3, max=60))
 async def get_top_logprobs_for_messages(
     messages: list[dict[str, str]],
     session: LLMRequestSession,
 ) -> list[TopLogprob]:
-    response = await CLIENT.chat.completions.create(
-        model=session.model_key,
-        messages=messages,  # type: ignore
-        stream=False,
-        temperature=1.0,
+    token_logprobs = await get_token_logprobs_for_messages(
+        messages, session, max_tokens=1
+    )
+    return token_logprobs[0].top_logprobs if token_logprobs else []
+
+
+async def get_token_logprobs_for_messages(
+    messages: list[dict[str, str]],
+    session: LLMRequestSession,
+    max_tokens: int,
+) -> list[ChatCompletionTokenLogprob]:
+    """Returns the sampled token and top logprobs at each completion position"""
+    if session.response_cache is None:
+        token_logprobs, usage = await _with_retry(
+            lambda: _get_token_logprobs_for_messages(messages, session, max_tokens)
+        )
+        _add_usage(session, usage.prompt_tokens, usage.completion_tokens)
+        return token_logprobs
+
+    async def fetch_serialised() -> CachedResponse:
+        token_logprobs, usage = await _with_retry(
+            lambda: _get_token_logprobs_for_messages(messages, session, max_tokens)
+        )
+        return CachedResponse(
+            orjson.dumps(
+                [token_logprob.model_dump() for token_logprob in token_logprobs]
+            ).decode(),
+            usage.prompt_tokens,
+            usage.completion_tokens,
+        )
+
+    response = await session.response_cache.cached_call(
+        session.model_key,
+        messages,
+        fetch_serialised,
         logprobs=True,
-        top_logprobs=20,
-        max_tokens=1,
-    )  # type: ignore
+        max_tokens=max_tokens,
+    )
+    # Charged here rather than by the request, so sessions sharing a request or
+    # served from the cache are each charged the same
+    _add_usage(session, response.input_tokens, response.output_tokens)
+    return [
+        ChatCompletionTokenLogprob.model_validate(token_logprob)
+        for token_logprob in orjson.loads(response.value)
+    ]
 
-    prompt_tokens = response.usage.prompt_tokens  # type: ignore
-    completion_tokens = response.usage.completion_tokens  # type: ignore
-    session.total_input_tokens += prompt_tokens
-    session.total_output_tokens += completion_tokens
 
+async def _get_token_logprobs_for_messages(
+    messages: list[dict[str, str]],
+    session: LLMRequestSession,
+    max_tokens: int,
+) -> tuple[list[ChatCompletionTokenLogprob], CompletionUsage]:
+    async with LLM_SEMAPHORE:
+        response = await CLIENT.chat.completions.create(
+            model=session.model_key,
+            messages=messages,  # type: ignore
+            stream=False,
+            temperature=1.0,
+            logprobs=True,
+            top_logprobs=20,
+            max_tokens=max_tokens,
+        )  # type: ignore
+
+    usage: CompletionUsage = response.usage  # type: ignore
     if response.choices[0].logprobs and response.choices[0].logprobs.content:
-        return response.choices[0].logprobs.content[0].top_logprobs
-    return []
+        return response.choices[0].logprobs.content, usage
+    return [], usage
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=3, max=60))
 async def get_response(
     messages: list[dict[str, str]],
     session: LLMRequestSession,
 ) -> str:
-    response = await CLIENT.chat.completions.create(
-        model=session.model_key,
-        messages=messages,  # type: ignore
-        stream=False,
-        temperature=1.0,
-    )  # type: ignore
-
-    prompt_tokens = response.usage.prompt_tokens  # type: ignore
-    completion_tokens = response.usage.completion_tokens  # type: ignore
-    session.total_input_tokens += prompt_tokens
-    session.total_output_tokens += completion_tokens
-
-    return response.choices[0].message.content  # type: ignore
+    if session.response_cache is None:
+        content, usage = await _with_retry(lambda: _get_response(messages, session))
+        _add_usage(session, usage.prompt_tokens, usage.completion_tokens)
+        return content
+
+    async def fetch() -> CachedResponse:
+        content, usage = await _with_retry(lambda: _get_response(messages, session))
+        return CachedResponse(content, usage.prompt_tokens, usage.completion_tokens)
+
+    # Options only join the cache key when they differ from the defaults, so
+    # default responses keep the keys they were cached under before any existed
+    request_options: dict[str, float] = {}
+    if session.max_response_tokens is not None:
+        request_options["max_tokens"] = session.max_response_tokens
+    if session.temperature != 1.0:
+        request_options["temperature"] = session.temperature
+    response = await session.response_cache.cached_call(
+        session.model_key, messages, fetch, **request_options
+    )
+    _add_usage(session, response.input_tokens, response.output_tokens)
+    return response.value
+
+
+async def _get_response(
+    messages: list[dict[str, str]],
+    session: LLMRequestSession,
+) -> tuple[str, CompletionUsage]:
+    async with LLM_SEMAPHORE:
+        response = await CLIENT.chat.completions.create(
+            model=session.model_key,
+            messages=messages,  # type: ignore
+            stream=False,
+            temperature=session.temperature,
+            max_tokens=(
+                NOT_GIVEN
+                if session.max_response_tokens is None
+                else session.max_response_tokens
+            ),
+        )  # type: ignore
+
+    return response.choices[0].message.content, response.usage  # type: ignore
@@ -1,19 +1,29 @@
 from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class EvidenceNode:
     answer: str
     belief_state: dict[str, float]
     marginal_likelihood: float  # probability of picking this answer
     parent: "QuestionNode | None" = None
     children: list["QuestionNode"] = field(default_factory=list)
+    depth: int = field(init=False, repr=False)  # number of questions asked so far
+    # sharpness constant -> accumulated reward, which is fixed once the node exists
+    accumulated_rewards: dict[float, float] = field(
+        init=False, repr=False, default_factory=dict
+    )
+    # entropy of the belief state, filled in the first time it's needed
+    entropy: float | None = field(init=False, repr=False, default=None)
+
+    def __post_init__(self) -> None:
+        self.depth = 0 if self.parent is None else self.parent.parent.depth + 1
 
     def __str__(self) -> str:
         return f"Answer: '{self.answer}' | Marginal Likelihood: {self.marginal_likelihood} | Belief State: {self.belief_state}"
 
 
-@dataclass
+@dataclass(slots=True)
 class QuestionNode:
     question: str
     possible_answers: list[str]
@@ -27,10 +37,7 @@ class QuestionNode:
 
 
 def get_conversation_depth(node: EvidenceNode) -> int:
-    if node.parent is None:
-        return 0
-
-    return 1 + get_conversation_depth(node.parent.parent)
+    return node.depth
 
 
 def get_conversation_history(node: EvidenceNode) -> list[tuple[str, str]]:
@@ -46,30 +53,22 @@ def get_conversation_history(node: EvidenceNode) -> list[tuple[str, str]]:
 
 
 def stringify(root: EvidenceNode) -> str:
-    lines = []
-
-    def _build_string(
-        node: EvidenceNode | QuestionNode, prefix: str = "", is_last: bool = True
-    ):
+    lines = [str(root)]
+
+    # Children are pushed in reverse, so they are popped (and printed) in order
+    stack: list[tuple[EvidenceNode | QuestionNode, str, bool]] = [
+        (child, "", i == 0) for i, child in enumerate(reversed(root.children))
+    ]
+    while stack:
+        node, prefix, is_last = stack.pop()
         connector = "└── " if is_last else "├── "
+        lines.append(f"{prefix}{connector}{node}")
 
-        match node:
-            case EvidenceNode(_, _, _, _, children) as node:
-                lines.append(f"{prefix}{connector}{str(node)}")
-
-                for i, child in enumerate(children):
-                    new_prefix = prefix + ("    " if is_last else "│   ")
-                    _build_string(child, new_prefix, i == len(children) - 1)
-            case QuestionNode(_, _, _, children) as node:
-                lines.append(f"{prefix}{connector}{str(node)}")
-
-                for i, child in enumerate(children):
-                    new_prefix = prefix + ("    " if is_last else "│   ")
-                    _build_string(child, new_prefix, i == len(children) - 1)
-
-    lines.append(str(root))
-    for i, child in enumerate(root.children):
-        _build_string(child, "", i == len(root.children) - 1)
+        child_prefix = prefix + ("    " if is_last else "│   ")
+        stack.extend(
+            (child, child_prefix, i == 0)
+            for i, child in enumerate(reversed(node.children))
+        )
 
     return "\n".join(lines)
 
@@ -1,10 +1,12 @@
 import asyncio
+from collections.abc import Iterable
 from dataclasses import dataclass, field
 import logging
 
-from voyager import Index, Space
+import numpy as np
+from voyager import Index, Space, StorageDataType
 
-from globals import SENTENCE_TRANSFORMER
+from globals import get_sentence_transformer
 
 logger = logging.getLogger("Question Clustering")
 
@@ -14,23 +16,66 @@ class Cluster:
     questions: dict[str, int]
     # hypothesis -> answer -> likelihood
     likelihoods: dict[str, dict[str, float]] = field(default_factory=dict)
-    lock: asyncio.Lock = field(default_factory=lambda: asyncio.Lock())
+    # hypothesis -> set once the in-flight request for its likelihoods finishes
+    pending: dict[str, asyncio.Event] = field(default_factory=dict)
+    # Every hypothesis has likelihoods for the same answers. This is checked as
+    # likelihoods are added, so reading the answers back is free
+    answers: list[str] = field(init=False, default_factory=list)
+
+    def __post_init__(self) -> None:
+        if self.likelihoods:
+            self.answers = list(next(iter(self.likelihoods.values())))
+
+    def add_likelihoods(self, likelihoods: dict[str, dict[str, float]]) -> None:
+        for answer_likelihoods in likelihoods.values():
+            if not self.answers:
+                self.answers = list(answer_likelihoods)
+
+            assert answer_likelihoods.keys() == set(self.answers), (
+                "Hypotheses in cluster do not have consistent answers!"
+            )
+
+        self.likelihoods.update(likelihoods)
+
+    def claim_answers(self, answers: list[str]) -> list[str]:
+        """Fixes the cluster's answers on first use, and returns them"""
+        if not self.answers:
+            self.answers = list(answers)
+        return self.answers
+
+    def claim_hypotheses(
+        self, hypotheses: Iterable[str]
+    ) -> tuple[list[str], asyncio.Event, set[asyncio.Event]]:
+        """
+        Splits the hypotheses without likelihoods into those the caller must
+        request (finishing with `release_hypotheses`), and the events of
+        requests already in flight for the rest
+        """
+        to_request: list[str] = []
+        in_flight: set[asyncio.Event] = set()
+        for hypothesis in hypotheses:
+            if hypothesis in self.likelihoods:
+                continue
+            if (event := self.pending.get(hypothesis)) is not None:
+                in_flight.add(event)
+            else:
+                to_request.append(hypothesis)
+
+        requested = asyncio.Event()
+        for hypothesis in to_request:
+            self.pending[hypothesis] = requested
+        return to_request, requested, in_flight
+
+    def release_hypotheses(self, hypotheses: list[str], event: asyncio.Event) -> None:
+        for hypothesis in hypotheses:
+            del self.pending[hypothesis]
+        event.set()
 
     def get_hypotheses(self) -> list[str]:
         return list(self.likelihoods.keys())
 
     def get_answers(self) -> list[str]:
-        if not self.likelihoods:
-            return []
-
-        it = iter(self.likelihoods.values())
-        first_keys = set(next(it).keys())
-
-        assert all(set(answers.keys()) == first_keys for answers in it), (
-            "Hypotheses in cluster do not have consistent answers!"
-        )
-
-        return list(first_keys)
+        return self.answers
 
     def get_likelihoods_for_answer(self, answer: str) -> dict[str, float]:
         return {
@@ -41,25 +86,56 @@ class Cluster:
 
 class QuestionClustering:
     index: Index
-    clusters: dict[str, Cluster]
+    clusters: dict[int, Cluster]  # keyed by Voyager item id
     threshold: float
+    # Embeddings are deterministic, and the same question is often generated
+    # again on other branches, so each one only needs encoding once
+    embeddings: dict[str, np.ndarray]
 
-    def __init__(self, threshold: float):
+    def __init__(self, threshold: float, quantise_index: bool = False):
         logger.info(f"Setting up question cluster with threshold '{threshold}'")
-        self.index = Index(Space.Cosine, num_dimensions=768)
+        # 8-bit floats keep cosine distances within a few thousandths of float32, at
+        # a quarter of the memory. Near-duplicates can then also reach a similarity
+        # of 1.0, so a threshold of 1.0 no longer merges only exact duplicates
+        self.index = Index(
+            Space.Cosine,
+            num_dimensions=768,
+            storage_data_type=(
+                StorageDataType.E4M3 if quantise_index else StorageDataType.Float32
+            ),
+        )
         self.threshold = threshold
         self.clusters = {}
+        self.embeddings = {}
 
-    def get_cluster(self, question: str) -> Cluster:
-        embedding = SENTENCE_TRANSFORMER.encode(
-            question, convert_to_numpy=True, normalize_embeddings=False
+    def encode_questions(self, questions: list[str]) -> None:
+        """Embeds any questions not seen before in a single batch"""
+        new_questions = list(
+            dict.fromkeys(q for q in questions if q not in self.embeddings)
+        )
+        if not new_questions:
+            return
+
+        embeddings = get_sentence_transformer().encode(
+            new_questions,
+            batch_size=len(new_questions),
+            convert_to_numpy=True,
+            normalize_embeddings=False,
         )
+        self.embeddings.update(zip(new_questions, embeddings))
+
+    def get_cluster(self, question: str) -> Cluster:
+        if (embedding := self.embeddings.get(question)) is None:
+            embedding = get_sentence_transformer().encode(
+                question, convert_to_numpy=True, normalize_embeddings=False
+            )
+            self.embeddings[question] = embedding
         neighbours, distances = (
             self.index.query(embedding, k=1) if len(self.clusters) >= 1 else ([], [])
         )
 
         if len(neighbours) > 0 and 1 - distances[0] >= self.threshold:
-            best_cluster = self.clusters[str(neighbours[0])]
+            best_cluster = self.clusters[int(neighbours[0])]
             logger.info(
                 f"Cluster found for '{question}', with similarity {1 - distances[0]}!"
             )
@@ -69,7 +145,7 @@ class QuestionClustering:
             return best_cluster
 
         logger.info(f"Cluster not found for '{question}'. Creating new cluster...")
-        idx = str(self.index.add_item(embedding))
+        idx = self.index.add_item(embedding)
         new_cluster = Cluster(
             {question: 1},
         )
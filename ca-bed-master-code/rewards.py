@@ -7,10 +7,12 @@ def shannon_entropy(belief_state: dict[str, float]) -> float:
     return -sum(prob * math.log2(prob) for prob in belief_state.values() if prob > 0)
 
 
-def information_gain(
-    prior_belief_state: dict[str, float], posterior_belief_state: dict[str, float]
-) -> float:
-    return shannon_entropy(prior_belief_state) - shannon_entropy(posterior_belief_state)
+def belief_entropy(evidence: EvidenceNode) -> float:
+    # Belief states are never changed once a node exists, and every node is the
+    # prior for all of its grandchildren, so each entropy only needs working out once
+    if evidence.entropy is None:
+        evidence.entropy = shannon_entropy(evidence.belief_state)
+    return evidence.entropy
 
 
 def specificity_penalty(question: QuestionNode, sharpness_constant: float) -> float:
@@ -21,18 +23,29 @@ def specificity_penalty(question: QuestionNode, sharpness_constant: float) -> fl
 
 def immediate_reward(evidence: EvidenceNode, sharpness_constant: float) -> float:
     assert evidence.parent is not None, "Cannot determine reward of root node!"
-    return information_gain(
-        evidence.parent.parent.belief_state, evidence.belief_state
-    ) / (1 + specificity_penalty(evidence.parent, sharpness_constant))
+    return (belief_entropy(evidence.parent.parent) - belief_entropy(evidence)) / (
+        1 + specificity_penalty(evidence.parent, sharpness_constant)
+    )
 
 
 def accumulated_reward(evidence: EvidenceNode, sharpness_constant: float) -> float:
-    if evidence.parent is None:
-        return 0
-
-    return immediate_reward(evidence, sharpness_constant) + accumulated_reward(
-        evidence.parent.parent, sharpness_constant
-    )
+    # Sibling leaves share their whole path to the root, so walk up only as far
+    # as the nearest ancestor with a known reward, then fill the path back in
+    uncached_path: list[EvidenceNode] = []
+    reward = 0.0
+    node = evidence
+    while node.parent is not None:
+        if (cached := node.accumulated_rewards.get(sharpness_constant)) is not None:
+            reward = cached
+            break
+        uncached_path.append(node)
+        node = node.parent.parent
+
+    for node in reversed(uncached_path):
+        reward += immediate_reward(node, sharpness_constant)
+        node.accumulated_rewards[sharpness_constant] = reward
+
+    return reward
 
 
 def expected_reward(question: QuestionNode, sharpness_constant: float) -> float:
@@ -0,0 +1,62 @@
+from collections.abc import Awaitable, Callable
+import logging
+
+from voyager import Index, Space
+
+from globals import get_sentence_transformer
+
+logger = logging.getLogger("Semantic Cache")
+
+
+class SemanticAnswerCache:
+    """
+    Reuses answerer responses for semantically equivalent questions. Answers
+    are only shared within a scope (e.g. the suspect being interrogated), so
+    the same question put to different personas is never conflated.
+    """
+
+    indices: dict[str, Index]
+    answers: dict[str, dict[int, str]]
+    threshold: float
+
+    def __init__(self, threshold: float):
+        logger.info(f"Setting up semantic answer cache with threshold '{threshold}'")
+        self.threshold = threshold
+        self.indices = {}
+        self.answers = {}
+
+    async def cached_answer(
+        self, scope: str, question: str, fn: Callable[[], Awaitable[str]]
+    ) -> str:
+        embedding = get_sentence_transformer().encode(
+            question, convert_to_numpy=True, normalize_embeddings=False
+        )
+
+        if scope not in self.indices:
+            self.indices[scope] = Index(Space.Cosine, num_dimensions=768)
+            self.answers[scope] = {}
+        index, answers = self.indices[scope], self.answers[scope]
+
+        if answers:
+            neighbours, distances = index.query(embedding, k=1)
+            if 1 - distances[0] >= self.threshold:
+                logger.info(
+                    f"Reusing answer for '{question}', with similarity {1 - distances[0]}!"
+                )
+                return answers[neighbours[0]]
+
+        answer = await fn()
+        answers[index.add_item(embedding)] = answer
+        return answer
+
+
+async def get_cached_answer(
+    cache: SemanticAnswerCache | None,
+    scope: str,
+    question: str,
+    fn: Callable[[], Awaitable[str]],
+) -> str:
+    if cache is None:
+        return await fn()
+
+    return await cache.cached_answer(scope, question, fn)
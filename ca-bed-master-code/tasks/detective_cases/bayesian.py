@@ -4,11 +4,14 @@ from typing import override
 
 from models import LLMRequestSession, get_response, get_top_logprobs_for_messages
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.detective_cases.common import get_case_background, parse_question
-from tasks.detective_cases.data import DetectiveCasesInstance
+from tasks.detective_cases.data import DetectiveCasesInstance, SuspectInformation
 from tasks.tree_task import (
+    ASSISTANT_PRIMER,
     TreeTask,
-    normalise_logprobs,
+    answer_probabilities,
+    format_answer_list,
     parse_answer,
     parse_binary_questions,
 )
@@ -16,8 +19,12 @@ from tasks.tree_task import (
 
 class DetectiveCasesBayesian(TreeTask):
     instance: DetectiveCasesInstance
+    suspects_by_name: dict[str, SuspectInformation]
     background_info: str
     suspects_info: str
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
 
     def __init__(
         self,
@@ -31,6 +38,9 @@ class DetectiveCasesBayesian(TreeTask):
         confidence_threshold: float,
     ):
         self.instance = instance
+        self.suspects_by_name = {
+            suspect["name"]: suspect for suspect in instance["suspects"]
+        }
 
         self.background_info = get_case_background(self.instance)
         self.suspects_info = "\n".join(
@@ -58,6 +68,36 @@ class DetectiveCasesBayesian(TreeTask):
             hypothesis_space=[suspect["name"] for suspect in self.instance["suspects"]],
         )
 
+        background = dedent(f"""\
+            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
+
+            ### Case Background
+            {self.background_info}
+            """).strip()
+        suspects = dedent(f"""\
+            The investigation focuses on {len(self.hypothesis_space)} suspects:
+            {self.suspects_info}
+            """).strip()
+        self.question_prompt_prefix = f"{background}\n\n{suspects}"
+        self.question_prompt_suffix = dedent(f"""\
+            ### Task
+            Generate {self.max_question_nodes} excellent yes/no interrogation questions.
+            - Each question must be explicitly directed to a specific suspect.
+            - Format the question as: "[Suspect Name] Question text".
+            - Each question can only answered by 'Yes' or 'No'
+            - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
+
+            ### Response Format
+            One line per question:
+            1. <Question 1>
+            ...
+            n. <Question n>
+
+            ### Example
+            1. [Mr. Jones] Were you outside at 12:00PM? 
+            2. [Dr. Otto] Did you have access to the murder weapon?
+            """).strip()
+
     def __str__(self) -> str:
         return (
             "Detective Cases (Bayesian): "
@@ -72,27 +112,10 @@ class DetectiveCasesBayesian(TreeTask):
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            suspect: 1 / len(self.hypothesis_space) for suspect in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
-        parts = []
-        parts.append(
-            dedent(f"""\
-            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
-
-            ### Case Background
-            {self.background_info}
-            """).strip()
-        )
-
-        parts.append(
-            dedent(f"""\
-            The investigation focuses on {len(self.hypothesis_space)} suspects:
-            {self.suspects_info}
-            """).strip()
-        )
+        parts = [self.question_prompt_prefix]
 
         history = get_conversation_history(current_node)
         if history:
@@ -106,26 +129,7 @@ class DetectiveCasesBayesian(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent(f"""\
-            ### Task
-            Generate {self.max_question_nodes} excellent yes/no interrogation questions.
-            - Each question must be explicitly directed to a specific suspect.
-            - Format the question as: "[Suspect Name] Question text".
-            - Each question can only answered by 'Yes' or 'No'
-            - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
-
-            ### Response Format
-            One line per question:
-            1. <Question 1>
-            ...
-            n. <Question n>
-
-            ### Example
-            1. [Mr. Jones] Were you outside at 12:00PM? 
-            2. [Dr. Otto] Did you have access to the murder weapon?
-            """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
         return "\n\n".join(parts)
 
     @override
@@ -145,10 +149,12 @@ class DetectiveCasesBayesian(TreeTask):
         self, question: str, answers: list[str], hypotheses: list[str]
     ) -> dict[str, dict[str, float]]:
         answerer_name, actual_question = parse_question(self.hypothesis_space, question)
+        # The same for every hypothesis, so only built once per question
+        answer_list_str = format_answer_list(answers)
 
         tasks = []
         for hypothesis_name in hypotheses:
-            if hypothesis_name not in self.hypothesis_space:
+            if hypothesis_name not in self.hypothesis_set:
                 continue
 
             tasks.append(
@@ -157,6 +163,7 @@ class DetectiveCasesBayesian(TreeTask):
                     answerer_name=answerer_name,
                     actual_question=actual_question,
                     target_answers=answers,
+                    answer_list_str=answer_list_str,
                 )
             )
 
@@ -169,10 +176,7 @@ class DetectiveCasesBayesian(TreeTask):
             self.hypothesis_space, current_node.question
         )
 
-        suspect = next(
-            (s for s in self.instance["suspects"] if s["name"] == suspect_name),
-            None,
-        )
+        suspect = self.suspects_by_name.get(suspect_name)
         assert suspect is not None, f"Suspect '{suspect_name}' not found in case data"
 
         prompt = dedent(f"""\
@@ -194,9 +198,14 @@ class DetectiveCasesBayesian(TreeTask):
             "{question}"
             """).strip()
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            suspect_name,
+            question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)
 
@@ -206,11 +215,8 @@ class DetectiveCasesBayesian(TreeTask):
         answerer_name: str,
         actual_question: str,
         target_answers: list[str],
+        answer_list_str: str,
     ) -> tuple[str, dict[str, float]]:
-        answer_list_str = "\n".join(
-            f"{idx}. {answer}" for idx, answer in enumerate(target_answers, start=1)
-        )
-
         user_prompt = dedent(f"""\
             You are a detective investigating a murder case.
 
@@ -238,33 +244,13 @@ class DetectiveCasesBayesian(TreeTask):
 
             {answerer_name}'s answer was number:""").strip()
 
-        messages_for_api = [
-            {"role": "user", "content": user_prompt},
-            {"role": "assistant", "content": " "},  # Force start token
-        ]
+        messages_for_api = [{"role": "user", "content": user_prompt}, ASSISTANT_PRIMER]
 
         top_logprobs_list = await get_top_logprobs_for_messages(
             messages_for_api, self.questioner_session
         )
 
-        if not top_logprobs_list:
-            num_answers = len(target_answers)
-            return (
-                hypothesis_name,
-                {answer: 1.0 / num_answers for answer in target_answers},
-            )
-
-        logprob_lookup = {lp.token: lp.logprob for lp in top_logprobs_list}
-
-        raw_logprobs = {}
-        for i, answer in enumerate(target_answers, start=1):
-            target_token_str = f"{i}"
-            logprob_with_space = logprob_lookup.get(
-                f" {target_token_str}", -float("inf")
-            )
-            logprob_without_space = logprob_lookup.get(target_token_str, -float("inf"))
-            logprob = max(logprob_with_space, logprob_without_space)
-            raw_logprobs[answer] = logprob
-
-        normalised_probs = normalise_logprobs(raw_logprobs)
-        return (hypothesis_name, normalised_probs)
+        return (
+            hypothesis_name,
+            answer_probabilities(top_logprobs_list, target_answers),
+        )
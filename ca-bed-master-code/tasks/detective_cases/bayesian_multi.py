@@ -8,20 +8,32 @@ from models import (
     get_top_logprobs_for_messages,
 )
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.detective_cases.common import get_case_background, parse_question
-from tasks.detective_cases.data import DetectiveCasesInstance
+from tasks.detective_cases.data import DetectiveCasesInstance, SuspectInformation
 from tasks.tree_task import (
+    ASSISTANT_PRIMER,
     TreeTask,
-    normalise_logprobs,
+    answer_probabilities,
+    format_answer_list,
     parse_answer,
     parse_multi_questions,
 )
 
+# (hypothesis, answerer, question, answers)
+type LikelihoodKey = tuple[str, str, str, tuple[str, ...]]
+
 
 class DetectiveCasesBayesianWithMultibranching(TreeTask):
     instance: DetectiveCasesInstance
+    suspects_by_name: dict[str, SuspectInformation]
     background_info: str
     suspects_info: str
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
+    likelihood_cache: dict[LikelihoodKey, dict[str, float]]
+    in_flight_likelihoods: dict[LikelihoodKey, asyncio.Task[dict[str, float]]]
 
     def __init__(
         self,
@@ -35,6 +47,9 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
         confidence_threshold: float,
     ):
         self.instance = instance
+        self.suspects_by_name = {
+            suspect["name"]: suspect for suspect in instance["suspects"]
+        }
 
         self.background_info = get_case_background(self.instance)
         self.suspects_info = "\n".join(
@@ -45,6 +60,8 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
             """).strip()
             for idx, suspect in enumerate(self.instance["suspects"])
         )
+        self.likelihood_cache = {}
+        self.in_flight_likelihoods = {}
 
         super().__init__(
             questioner_session=questioner_session,
@@ -62,6 +79,37 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
             hypothesis_space=[suspect["name"] for suspect in self.instance["suspects"]],
         )
 
+        background = dedent(f"""\
+            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
+
+            ### Case Background
+            {self.background_info}
+            """).strip()
+        suspects = dedent(f"""\
+            The investigation focuses on {len(self.hypothesis_space)} suspects:
+            {self.suspects_info}
+            """).strip()
+        self.question_prompt_prefix = f"{background}\n\n{suspects}"
+        self.question_prompt_suffix = dedent(f"""\
+            ### Task
+            Generate {self.max_question_nodes} excellent interrogation questions.  
+            - Each question must be explicitly directed to a specific suspect.  
+            - Format the question as: "[Suspect Name] Question text".
+            - Provide a realistic set of possible answers for that suspect.  
+            - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
+
+            ### Response Format
+            One line per question:
+            1. <Question 1>|Answer1|Answer2|Answer3
+            2. <Question 2>|Answer1|Answer2
+            ...
+            n. <Question n>|Answer1|Answer2|Answer3|...|AnswerK
+
+            ### Example
+            1. [Mr. Jones] Where were you at the time of the murder?|In the kitchen|In the garden|With the victim  
+            2. [Dr. Otto] Did you have access to the murder weapon?|Yes|No
+            """).strip()
+
     def __str__(self) -> str:
         return (
             "Detective Cases (Bayesian + Multibranching): "
@@ -76,27 +124,10 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            suspect: 1 / len(self.hypothesis_space) for suspect in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
-        parts = []
-        parts.append(
-            dedent(f"""\
-            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
-
-            ### Case Background
-            {self.background_info}
-            """).strip()
-        )
-
-        parts.append(
-            dedent(f"""\
-            The investigation focuses on {len(self.hypothesis_space)} suspects:
-            {self.suspects_info}
-            """).strip()
-        )
+        parts = [self.question_prompt_prefix]
 
         history = get_conversation_history(current_node)
         if history:
@@ -110,27 +141,7 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent(f"""\
-            ### Task
-            Generate {self.max_question_nodes} excellent interrogation questions.  
-            - Each question must be explicitly directed to a specific suspect.  
-            - Format the question as: "[Suspect Name] Question text".
-            - Provide a realistic set of possible answers for that suspect.  
-            - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
-
-            ### Response Format
-            One line per question:
-            1. <Question 1>|Answer1|Answer2|Answer3
-            2. <Question 2>|Answer1|Answer2
-            ...
-            n. <Question n>|Answer1|Answer2|Answer3|...|AnswerK
-
-            ### Example
-            1. [Mr. Jones] Where were you at the time of the murder?|In the kitchen|In the garden|With the victim  
-            2. [Dr. Otto] Did you have access to the murder weapon?|Yes|No
-            """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
         return "\n\n".join(parts)
 
     @override
@@ -150,10 +161,12 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
         self, question: str, answers: list[str], hypotheses: list[str]
     ) -> dict[str, dict[str, float]]:
         answerer_name, actual_question = parse_question(self.hypothesis_space, question)
+        # The same for every hypothesis, so only built once per question
+        answer_list_str = format_answer_list(answers)
 
         tasks = []
         for hypothesis_name in hypotheses:
-            if hypothesis_name not in self.hypothesis_space:
+            if hypothesis_name not in self.hypothesis_set:
                 continue
 
             tasks.append(
@@ -162,6 +175,7 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
                     answerer_name=answerer_name,
                     actual_question=actual_question,
                     target_answers=answers,
+                    answer_list_str=answer_list_str,
                 )
             )
 
@@ -174,10 +188,7 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
             self.hypothesis_space, current_node.question
         )
 
-        suspect = next(
-            (s for s in self.instance["suspects"] if s["name"] == suspect_name),
-            None,
-        )
+        suspect = self.suspects_by_name.get(suspect_name)
         assert suspect is not None, f"Suspect '{suspect_name}' not found in case data"
         answers = [child.answer for child in current_node.children]
 
@@ -200,9 +211,14 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
             "{question}"
             """).strip()
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            f"{suspect_name}: {answers}",
+            question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)
 
@@ -212,11 +228,47 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
         answerer_name: str,
         actual_question: str,
         target_answers: list[str],
+        answer_list_str: str,
     ) -> tuple[str, dict[str, float]]:
-        answer_list_str = "\n".join(
-            f"{idx}. {answer}" for idx, answer in enumerate(target_answers, start=1)
+        # The same question can come up again on other branches of the tree
+        cache_key: LikelihoodKey = (
+            hypothesis_name,
+            answerer_name,
+            actual_question,
+            tuple(target_answers),
         )
+        if (cached := self.likelihood_cache.get(cache_key)) is not None:
+            return (hypothesis_name, cached)
+
+        # Branches expanding concurrently can race on the same key, so they
+        # share a single request rather than each making their own
+        if (task := self.in_flight_likelihoods.get(cache_key)) is None:
+            task = asyncio.ensure_future(
+                self._request_likelihoods(
+                    cache_key,
+                    hypothesis_name,
+                    answerer_name,
+                    actual_question,
+                    target_answers,
+                    answer_list_str,
+                )
+            )
+            self.in_flight_likelihoods[cache_key] = task
+            task.add_done_callback(
+                lambda _: self.in_flight_likelihoods.pop(cache_key, None)
+            )
+
+        return (hypothesis_name, await asyncio.shield(task))
 
+    async def _request_likelihoods(
+        self,
+        cache_key: LikelihoodKey,
+        hypothesis_name: str,
+        answerer_name: str,
+        actual_question: str,
+        target_answers: list[str],
+        answer_list_str: str,
+    ) -> dict[str, float]:
         user_prompt = dedent(f"""\
             You are a detective investigating a murder case.
 
@@ -244,33 +296,12 @@ class DetectiveCasesBayesianWithMultibranching(TreeTask):
 
             {answerer_name}'s answer was number:""").strip()
 
-        messages_for_api = [
-            {"role": "user", "content": user_prompt},
-            {"role": "assistant", "content": " "},  # Force start token
-        ]
+        messages_for_api = [{"role": "user", "content": user_prompt}, ASSISTANT_PRIMER]
 
         top_logprobs_list = await get_top_logprobs_for_messages(
             messages_for_api, self.questioner_session
         )
 
-        if not top_logprobs_list:
-            num_answers = len(target_answers)
-            return (
-                hypothesis_name,
-                {answer: 1.0 / num_answers for answer in target_answers},
-            )
-
-        logprob_lookup = {lp.token: lp.logprob for lp in top_logprobs_list}
-
-        raw_logprobs = {}
-        for i, answer in enumerate(target_answers, start=1):
-            target_token_str = f"{i}"
-            logprob_with_space = logprob_lookup.get(
-                f" {target_token_str}", -float("inf")
-            )
-            logprob_without_space = logprob_lookup.get(target_token_str, -float("inf"))
-            logprob = max(logprob_with_space, logprob_without_space)
-            raw_logprobs[answer] = logprob
-
-        normalised_probs = normalise_logprobs(raw_logprobs)
-        return (hypothesis_name, normalised_probs)
+        normalised_probs = answer_probabilities(top_logprobs_list, target_answers)
+        self.likelihood_cache[cache_key] = normalised_probs
+        return normalised_probs
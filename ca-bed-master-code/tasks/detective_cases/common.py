@@ -1,13 +1,23 @@
+from functools import lru_cache
 import re
 from textwrap import dedent
 
 from tasks.detective_cases.data import DetectiveCasesInstance
 
+QUESTION_PATTERN = re.compile(r"\[(.*?)\]\s*(.*)")
+
+
+@lru_cache(maxsize=4096)
+def _split_question(question: str) -> tuple[str, str] | None:
+    # The same question is parsed again for every likelihood and answer request
+    suspect_match = QUESTION_PATTERN.match(question)
+    return suspect_match.groups() if suspect_match else None  # type: ignore
+
 
 def parse_question(hypothesis_space: list[str], question: str) -> tuple[str, str]:
-    suspect_match = re.match(r"\[(.*?)\]\s*(.*)", question)
-    assert suspect_match, f"Bad question: {question}"
-    suspect_name, actual_question = suspect_match.groups()
+    split_question = _split_question(question)
+    assert split_question, f"Bad question: {question}"
+    suspect_name, actual_question = split_question
     if suspect_name in hypothesis_space:
         return suspect_name, actual_question
 
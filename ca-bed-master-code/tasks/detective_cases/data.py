@@ -46,10 +46,11 @@ def load_all_data() -> list[DetectiveCasesInstance]:
     with data_path.open("r", encoding="utf-8") as f:
         data = json.load(f)
 
-    # Murderer is always index 0
-    random.seed(42)
+    # Murderer is always index 0. Shuffle with a local generator, so that
+    # loading the data doesn't reseed the global one for the rest of the process
+    rng = random.Random(42)
     for instance in data:
-        random.shuffle(instance["suspects"])
+        rng.shuffle(instance["suspects"])
 
     return cast(list[DetectiveCasesInstance], data)
 
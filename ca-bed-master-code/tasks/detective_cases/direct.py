@@ -1,20 +1,47 @@
-import re
 from textwrap import dedent
 from typing import override
 
 from models import LLMRequestSession, get_response
-from node import EvidenceNode, get_conversation_history
+from node import EvidenceNode, get_conversation_depth, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.detective_cases.common import get_case_background, parse_question
-from tasks.detective_cases.data import DetectiveCasesInstance
+from tasks.detective_cases.data import DetectiveCasesInstance, SuspectInformation
 from tasks.direct_prompting_task import (
+    PREDICTION_RESPONSE_PATTERN,
+    QUESTION_RESPONSE_PATTERN,
     DirectPromptingTask,
     Prediction,
     Question,
 )
 
+TARGETTING_PROMPT = "Now you should make predicitions instead of asking questions"
+# Dedented once at import rather than on every task
+QUESTION_PROMPT_SUFFIX = dedent("""\
+    ### Task
+    Your goal is to identify the correct culprit.
+    You can either ask a question to a specific suspect to gather more information,
+    or you can make a prediction. If you ask a question, it MUST only be answerable
+    by either a 'Yes' or 'No'.
+           
+    ### Response Format
+    If you are confident enough to make a prediction, output:
+    [PREDICTION]: <Exact suspect name>
+           
+    E.g., [PREDICTION]: Dr. Rose
+
+    Otherwise, if you need more information, output:
+    [QUESTION]: [Suspect Name] <Question text>
+    
+    E.g., [QUESTION]: [Professor Karpov] Where were you at 12:00PM?
+    """)
+
 
 class DetectiveCasesDirect(DirectPromptingTask):
     instance: DetectiveCasesInstance
+    suspects_by_name: dict[str, SuspectInformation]
+    # Parts of the questioner prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
 
     def __init__(
         self,
@@ -24,6 +51,9 @@ class DetectiveCasesDirect(DirectPromptingTask):
         max_conversation_depth: int,
     ):
         self.instance = instance
+        self.suspects_by_name = {
+            suspect["name"]: suspect for suspect in instance["suspects"]
+        }
         super().__init__(
             questioner_session=questioner_session,
             answerer_session=answerer_session,
@@ -36,42 +66,36 @@ class DetectiveCasesDirect(DirectPromptingTask):
             hypothesis_space=[suspect["name"] for suspect in self.instance["suspects"]],
         )
 
-    def __str__(self) -> str:
-        return f"Detective Cases (Direct): {self.task_answer=} {self.max_conversation_depth=} {self.hypothesis_space=}"
-
-    @override
-    async def query_questioner(
-        self, current_node: EvidenceNode
-    ) -> Question | Prediction:
-        parts = []
-
-        # Case background
-        parts.append(
-            dedent(f"""\
+        background = dedent(f"""\
             You are a detective investigating a murder.  
 
             ### Case Background
             {get_case_background(self.instance)}
             """).strip()
-        )
-
-        # Suspects info
-        suspects_info_parts = []
-        for idx, suspect in enumerate(self.instance["suspects"], start=1):
-            suspects_info_parts.append(
-                dedent(f"""\
-                - Suspect {idx}:
-                    - Name: {suspect["name"]}
-                    - Introduction: {suspect["introduction"]}
-                """).strip()
-            )
-        suspects_info = "\n".join(suspects_info_parts)
-        parts.append(
+        suspects_info = "\n".join(
             dedent(f"""\
+            - Suspect {idx}:
+                - Name: {suspect["name"]}
+                - Introduction: {suspect["introduction"]}
+            """).strip()
+            for idx, suspect in enumerate(self.instance["suspects"], start=1)
+        )
+        suspects = dedent(f"""\
             The investigation focuses on {len(self.hypothesis_space)} suspects:
             {suspects_info}
             """).strip()
-        )
+        self.question_prompt_prefix = f"{background}\n\n{suspects}"
+        self.question_prompt_suffix = QUESTION_PROMPT_SUFFIX
+
+    def __str__(self) -> str:
+        return f"Detective Cases (Direct): {self.task_answer=} {self.max_conversation_depth=} {self.hypothesis_space=}"
+
+    @override
+    async def query_questioner(
+        self, current_node: EvidenceNode
+    ) -> Question | Prediction:
+        # Case background and suspects info
+        parts = [self.question_prompt_prefix]
 
         # Conversation history
         history = get_conversation_history(current_node)
@@ -85,34 +109,11 @@ class DetectiveCasesDirect(DirectPromptingTask):
             )
 
         # Instructions
-        parts.append(
-            dedent("""\
-            ### Task
-            Your goal is to identify the correct culprit.
-            You can either ask a question to a specific suspect to gather more information,
-            or you can make a prediction. If you ask a question, it MUST only be answerable
-            by either a 'Yes' or 'No'.
-                   
-            ### Response Format
-            If you are confident enough to make a prediction, output:
-            [PREDICTION]: <Exact suspect name>
-                   
-            E.g., [PREDICTION]: Dr. Rose
-
-            Otherwise, if you need more information, output:
-            [QUESTION]: [Suspect Name] <Question text>
-            
-            E.g., [QUESTION]: [Professor Karpov] Where were you at 12:00PM?
-            """)
-        )
+        parts.append(self.question_prompt_suffix)
 
         # Targetting prompt
-        if len(history) >= self.max_conversation_depth - 3:
-            parts.append(
-                dedent("""
-                Now you should make predicitions instead of asking questions
-                """).strip()
-            )
+        if get_conversation_depth(current_node) >= self.max_conversation_depth - 3:
+            parts.append(TARGETTING_PROMPT)
 
         # Query LLM
         prompt = "\n\n".join(parts)
@@ -122,17 +123,17 @@ class DetectiveCasesDirect(DirectPromptingTask):
         )
 
         # Parse LLM
-        question_match = re.search(r"\[QUESTION\]:\s*(.*)", output, re.IGNORECASE)
-        prediction_match = re.search(
-            r"\[(PREDICTION|ANSWER|PREDECTION)\]:\s*(.*)", output, re.IGNORECASE
-        )
+        # Any question wins over a prediction in the same response (one naming an
+        # unknown suspect raises), so only look for a prediction once there's no
+        # question
+        question_match = QUESTION_RESPONSE_PATTERN.search(output)
 
         if question_match and parse_question(
             self.hypothesis_space, question_match.group(1).strip()
         ):
             return Question(question_match.group(1).strip())
-        elif prediction_match:
-            return Prediction(prediction_match.group(2).strip())
+        elif prediction_match := PREDICTION_RESPONSE_PATTERN.search(output):
+            return Prediction(prediction_match.group(1).strip())
         else:
             raise RuntimeError(f"Response does not match expected structure, {output}")
 
@@ -140,10 +141,7 @@ class DetectiveCasesDirect(DirectPromptingTask):
     async def query_answerer(self, question: str) -> str:
         suspect_name, actual_question = parse_question(self.hypothesis_space, question)
 
-        suspect = next(
-            (s for s in self.instance["suspects"] if s["name"] == suspect_name),
-            None,
-        )
+        suspect = self.suspects_by_name.get(suspect_name)
         assert suspect is not None, f"Suspect '{suspect_name}' not found in case data"
 
         prompt = dedent(f"""\
@@ -164,7 +162,12 @@ class DetectiveCasesDirect(DirectPromptingTask):
             "{actual_question}"
         """)
 
-        return await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        return await get_cached_answer(
+            self.semantic_cache,
+            suspect_name,
+            actual_question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
@@ -2,8 +2,9 @@ from textwrap import dedent
 from typing import override
 from models import LLMRequestSession, get_response
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.detective_cases.common import get_case_background, parse_question
-from tasks.detective_cases.data import DetectiveCasesInstance
+from tasks.detective_cases.data import DetectiveCasesInstance, SuspectInformation
 from tasks.tree_task import (
     TreeTask,
     parse_answer,
@@ -11,11 +12,35 @@ from tasks.tree_task import (
     parse_categorical_likelihoods,
 )
 
+# Dedented once at import rather than on every task
+QUESTION_PROMPT_SUFFIX_TEMPLATE = dedent("""\
+    ### Task
+    Generate {max_question_nodes} excellent yes/no interrogation questions.
+    - Each question must be explicitly directed to a specific suspect.
+    - Format the question as: "[Suspect Name] Question text".
+    - Each question can only answered by 'Yes' or 'No'
+    - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
+
+    ### Response Format
+    One line per question:
+    1. <Question 1>
+    ...
+    n. <Question n>
+
+    ### Example
+    1. [Mr. Jones] Were you outside at 12:00PM? 
+    2. [Dr. Otto] Did you have access to the murder weapon?
+    """).strip()
+
 
 class DetectiveCasesUoT(TreeTask):
     instance: DetectiveCasesInstance
+    suspects_by_name: dict[str, SuspectInformation]
     background_info: str
     suspects_info: str
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
 
     def __init__(
         self,
@@ -29,6 +54,9 @@ class DetectiveCasesUoT(TreeTask):
         confidence_threshold: float,
     ):
         self.instance = instance
+        self.suspects_by_name = {
+            suspect["name"]: suspect for suspect in instance["suspects"]
+        }
 
         self.background_info = get_case_background(self.instance)
         self.suspects_info = "\n".join(
@@ -56,6 +84,21 @@ class DetectiveCasesUoT(TreeTask):
             hypothesis_space=[suspect["name"] for suspect in self.instance["suspects"]],
         )
 
+        background = dedent(f"""\
+            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
+
+            ### Case Background
+            {self.background_info}
+            """).strip()
+        suspects = dedent(f"""\
+            The investigation focuses on {len(self.hypothesis_space)} suspects:
+            {self.suspects_info}
+            """).strip()
+        self.question_prompt_prefix = f"{background}\n\n{suspects}"
+        self.question_prompt_suffix = QUESTION_PROMPT_SUFFIX_TEMPLATE.format(
+            max_question_nodes=self.max_question_nodes
+        )
+
     def __str__(self) -> str:
         return (
             "Detective Cases (UoT): "
@@ -70,27 +113,10 @@ class DetectiveCasesUoT(TreeTask):
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            suspect: 1 / len(self.hypothesis_space) for suspect in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
-        parts = []
-        parts.append(
-            dedent(f"""\
-            You are a detective investigating a murder. You can ask up to {self.max_conversation_depth} questions.
-
-            ### Case Background
-            {self.background_info}
-            """).strip()
-        )
-
-        parts.append(
-            dedent(f"""\
-            The investigation focuses on {len(self.hypothesis_space)} suspects:
-            {self.suspects_info}
-            """).strip()
-        )
+        parts = [self.question_prompt_prefix]
 
         history = get_conversation_history(current_node)
         if history:
@@ -104,26 +130,7 @@ class DetectiveCasesUoT(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent(f"""\
-            ### Task
-            Generate {self.max_question_nodes} excellent yes/no interrogation questions.
-            - Each question must be explicitly directed to a specific suspect.
-            - Format the question as: "[Suspect Name] Question text".
-            - Each question can only answered by 'Yes' or 'No'
-            - Focus on questions that help distinguish between suspects (motive, alibi, opportunity, access to weapon).
-
-            ### Response Format
-            One line per question:
-            1. <Question 1>
-            ...
-            n. <Question n>
-
-            ### Example
-            1. [Mr. Jones] Were you outside at 12:00PM? 
-            2. [Dr. Otto] Did you have access to the murder weapon?
-            """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
         return "\n\n".join(parts)
 
     @override
@@ -144,16 +151,8 @@ class DetectiveCasesUoT(TreeTask):
     ) -> dict[str, dict[str, float]]:
         answerer_name, actual_question = parse_question(self.hypothesis_space, question)
 
-        suspects = [s for s in self.instance["suspects"] if s["name"] in hypotheses]
-        assert len(suspects) > 0, f"No matching suspect found in question: {question}"
-
-        suspects_info = "\n".join(
-            dedent(f"""\
-            - Suspect {idx + 1}:
-                - Name: {suspect["name"]}
-                - Introduction: {suspect["introduction"]}
-            """).strip()
-            for idx, suspect in enumerate(self.instance["suspects"])
+        assert any(hypothesis in self.suspects_by_name for hypothesis in hypotheses), (
+            f"No matching suspect found in question: {question}"
         )
 
         # Prompt
@@ -161,10 +160,10 @@ class DetectiveCasesUoT(TreeTask):
             You are a detective investigating a murder case.
 
             ### Case Background
-            {get_case_background(self.instance)}
+            {self.background_info}
 
             ### Suspects
-            {suspects_info}
+            {self.suspects_info}
 
             ### Question to {answerer_name}
             "{actual_question}"
@@ -198,11 +197,10 @@ class DetectiveCasesUoT(TreeTask):
             session=self.questioner_session,
         )
         likelihoods = parse_categorical_likelihoods(output, possible_answers=answers)
+        # The parser builds every vector from the answers themselves, so their
+        # lengths always match
         return {
-            likelihood.hypothesis: {
-                ans: prob
-                for ans, prob in zip(answers, likelihood.likelihoods, strict=True)
-            }
+            likelihood.hypothesis: dict(zip(answers, likelihood.likelihoods))
             for likelihood in likelihoods
         }
 
@@ -212,10 +210,7 @@ class DetectiveCasesUoT(TreeTask):
             self.hypothesis_space, current_node.question
         )
 
-        suspect = next(
-            (s for s in self.instance["suspects"] if s["name"] == suspect_name),
-            None,
-        )
+        suspect = self.suspects_by_name.get(suspect_name)
         assert suspect is not None, f"Suspect '{suspect_name}' not found in case data"
 
         prompt = dedent(f"""\
@@ -237,8 +232,13 @@ class DetectiveCasesUoT(TreeTask):
             "{question}"
             """).strip()
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            suspect_name,
+            question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)
@@ -1,8 +1,15 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+import re
 
 from models import LLMRequestSession
 from node import EvidenceNode
+from semantic_cache import SemanticAnswerCache
+
+QUESTION_RESPONSE_PATTERN = re.compile(r"\[QUESTION\]:\s*(.*)", re.IGNORECASE)
+PREDICTION_RESPONSE_PATTERN = re.compile(
+    r"\[(?:PREDICTION|ANSWER|PREDECTION)\]:\s*(.*)", re.IGNORECASE
+)
 
 
 @dataclass
@@ -19,8 +26,10 @@ class DirectPromptingTask(ABC):
     questioner_session: LLMRequestSession
     answerer_session: LLMRequestSession
     task_answer: str
+    normalised_task_answer: str
     max_conversation_depth: int
     hypothesis_space: list[str]
+    semantic_cache: SemanticAnswerCache | None
 
     def __init__(
         self,
@@ -33,8 +42,10 @@ class DirectPromptingTask(ABC):
         self.questioner_session = questioner_session
         self.answerer_session = answerer_session
         self.task_answer = task_answer
+        self.normalised_task_answer = task_answer.strip().casefold()
         self.max_conversation_depth = max_conversation_depth
         self.hypothesis_space = hypothesis_space
+        self.semantic_cache = None
 
     @abstractmethod
     async def query_questioner(
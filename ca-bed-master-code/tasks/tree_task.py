@@ -1,12 +1,34 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from functools import lru_cache
+import math
 import re
+from typing import Any
 
-import numpy as np
-from globals import SENTENCE_TRANSFORMER
+from globals import get_sentence_transformer
+from openai.types.chat.chat_completion_token_logprob import TopLogprob
 
 from models import LLMRequestSession
 from node import EvidenceNode, QuestionNode
+from semantic_cache import SemanticAnswerCache
+
+NEG_INF = float("-inf")
+
+# Follows the prompt of every likelihood request to force the start token.
+# One dict is shared by all of them, so it must never be mutated
+ASSISTANT_PRIMER = {"role": "assistant", "content": " "}
+
+# Lines starting with optional whitespace, one or more digits, a period and
+# more whitespace, capturing the rest of the line
+QUESTION_LINE_PATTERN = re.compile(r"^\s*\d+\.\s+(.*)")
+# Lines like "Label: item1, item2"
+LABEL_LINE_PATTERN = re.compile(r"^\s*([^:]+):\s*(.*)$")
+# Standalone "yes" or "no" words in an answer
+YES_NO_PATTERN = re.compile(r"\b(yes|no)\b")
+
+# Embeddings of each set of answer options seen by parse_answer, oldest first
+MAX_CACHED_CANDIDATE_EMBEDDINGS = 4096
+_candidate_embeddings: dict[tuple[str, ...], Any] = {}
 
 
 class TreeTask(ABC):
@@ -19,6 +41,9 @@ class TreeTask(ABC):
     confidence_threshold: float
     estimator_confidence: float
     hypothesis_space: list[str]
+    # For membership checks, which the list makes linear
+    hypothesis_set: frozenset[str]
+    semantic_cache: SemanticAnswerCache | None
 
     def __init__(
         self,
@@ -41,6 +66,8 @@ class TreeTask(ABC):
         self.confidence_threshold = confidence_threshold
         self.estimator_confidence = estimator_confidence
         self.hypothesis_space = hypothesis_space
+        self.hypothesis_set = frozenset(hypothesis_space)
+        self.semantic_cache = None
 
     @abstractmethod
     async def create_initial_belief_state(self) -> dict[str, float]:
@@ -68,25 +95,59 @@ def normalise_logprobs(logprobs_dict: dict[str, float]) -> dict[str, float]:
     Converts a dictionary of logprobs into a normalised
     probability distribution.
     """
-    keys = list(logprobs_dict.keys())
-    logprobs_array = np.array(list(logprobs_dict.values()))
-
-    max_logprob = np.max(logprobs_array)
+    # There are only ever a handful of answers, where plain floats beat the
+    # overhead of building and reducing NumPy arrays
+    max_logprob = max(logprobs_dict.values(), default=NEG_INF)
 
     # If all logprobs are near 0, then return uniform
-    if max_logprob == -np.inf:
-        num_keys = len(keys)
+    if max_logprob == NEG_INF:
+        num_keys = len(logprobs_dict)
         if num_keys == 0:
             return {}
-        return {key: 1.0 / num_keys for key in keys}
+        return {key: 1.0 / num_keys for key in logprobs_dict}
+
+    exp_logprobs = {
+        key: math.exp(logprob - max_logprob) for key, logprob in logprobs_dict.items()
+    }
+    sum_exp_logprobs = sum(exp_logprobs.values())
+
+    return {key: prob / sum_exp_logprobs for key, prob in exp_logprobs.items()}
+
+
+def format_answer_list(answers: list[str]) -> str:
+    """Numbers the answers, for likelihood prompts to be answered by number"""
+    return "\n".join(f"{idx}. {answer}" for idx, answer in enumerate(answers, start=1))
+
 
-    shifted_logprobs = logprobs_array - max_logprob
-    exp_logprobs = np.exp(shifted_logprobs)
-    sum_exp_logprobs = np.sum(exp_logprobs)
+@lru_cache(maxsize=64)
+def _answer_number_indices(num_answers: int) -> dict[str, int]:
+    # Answer numbers may be tokenised with or without a leading space
+    return {
+        token: idx
+        for idx in range(num_answers)
+        for token in (f"{idx + 1}", f" {idx + 1}")
+    }
 
-    normalised_probs = exp_logprobs / sum_exp_logprobs
 
-    return {key: float(prob) for key, prob in zip(keys, normalised_probs)}
+def is_answer_number(token: str, num_answers: int) -> bool:
+    return token in _answer_number_indices(num_answers)
+
+
+def answer_probabilities(
+    top_logprobs_list: list[TopLogprob], target_answers: list[str]
+) -> dict[str, float]:
+    """Distribution over numbered answers, from the logprobs of their numbers"""
+    number_indices = _answer_number_indices(len(target_answers))
+
+    # Each returned token is looked up once, keeping the likelier of the two
+    # tokenisations of every number
+    logprobs = [NEG_INF] * len(target_answers)
+    for top_logprob in top_logprobs_list:
+        idx = number_indices.get(top_logprob.token)
+        if idx is not None and top_logprob.logprob > logprobs[idx]:
+            logprobs[idx] = top_logprob.logprob
+
+    return normalise_logprobs(dict(zip(target_answers, logprobs)))
 
 
 @dataclass
@@ -96,16 +157,12 @@ class Question:
 
 
 def parse_multi_questions(output: str) -> list[Question]:
-    output.replace("\\n", "\n")
+    output = output.replace("\\n", "\n")
 
     questions: list[Question] = []
 
-    # Regex to find lines starting with optional whitespace, one or more digits,
-    # a period, more whitespace, and then captures the rest of the line.
-    question_pattern = re.compile(r"^\s*\d+\.\s+(.*)")
-
     for line in output.splitlines():
-        match = question_pattern.match(line)
+        match = QUESTION_LINE_PATTERN.match(line)
         if match:
             # group(1) contains the captured question text
             question_text = match.group(1).strip()
@@ -118,16 +175,12 @@ def parse_multi_questions(output: str) -> list[Question]:
 
 
 def parse_binary_questions(output: str) -> list[Question]:
-    output.replace("\\n", "\n")
+    output = output.replace("\\n", "\n")
 
     questions: list[Question] = []
 
-    # Regex to find lines starting with optional whitespace, one or more digits,
-    # a period, more whitespace, and then captures the rest of the line.
-    question_pattern = re.compile(r"^\s*\d+\.\s+(.*)")
-
     for line in output.splitlines():
-        match = question_pattern.match(line)
+        match = QUESTION_LINE_PATTERN.match(line)
         if match:
             # group(1) contains the captured question text
             question_text = match.group(1).strip()
@@ -151,23 +204,24 @@ def parse_categorical_likelihoods(
 
     label_to_items: dict[str, list[str]] = {}
 
-    # Match lines like "Label: item1, item2"
-    line_pattern = re.compile(r"^\s*([^:]+):\s*(.*)$")
-
     for line in output.splitlines():
-        if match := line_pattern.match(line):
+        if match := LABEL_LINE_PATTERN.match(line):
             label = match.group(1).strip()
             items = [s.strip() for s in match.group(2).split(",") if s.strip()]
             label_to_items[label] = items
 
-    all_items = sorted({item for items in label_to_items.values() for item in items})
+    # Invert to the labels each item was listed under, so building the vectors
+    # doesn't scan every label's list once per item
+    item_to_labels: dict[str, set[str]] = {}
+    for label, items in label_to_items.items():
+        for item in items:
+            item_to_labels.setdefault(item, set()).add(label)
 
     likelihoods: list[Likelihood] = []
 
-    for item in all_items:
-        vector = [
-            1.0 if item in label_to_items[label] else 1e-5 for label in possible_answers
-        ]
+    for item in sorted(item_to_labels):
+        labels = item_to_labels[item]
+        vector = [1.0 if label in labels else 1e-5 for label in possible_answers]
         likelihoods.append(Likelihood(hypothesis=item, likelihoods=vector))
 
     return likelihoods
@@ -175,21 +229,38 @@ def parse_categorical_likelihoods(
 
 def parse_answer(output: str, question_node: QuestionNode) -> EvidenceNode:
     llm_answer = output.strip().lower()
+    candidate_answers = tuple(c.answer.strip() for c in question_node.children)
+    lowered_answers = [answer.lower() for answer in candidate_answers]
 
     # First try exact match (case-insensitive)
-    for child in question_node.children:
-        if child.answer.strip().lower() == llm_answer:
-            return child
-
-    # Fall back to semantic similarity
-    candidate_answers = [c.answer.strip() for c in question_node.children]
-    answer_embeddings = SENTENCE_TRANSFORMER.encode(
-        candidate_answers, convert_to_tensor=True, normalize_embeddings=True
-    )
-    output_embedding = SENTENCE_TRANSFORMER.encode(
-        [llm_answer], convert_to_tensor=True, normalize_embeddings=True
-    )
-    similarities = SENTENCE_TRANSFORMER.similarity(
+    if llm_answer in lowered_answers:
+        return question_node.children[lowered_answers.index(llm_answer)]
+
+    # Yes/no questions are by far the most common, and an answer like "Yes,
+    # I was." names its option outright, so skip the embedding there
+    if sorted(lowered_answers) == ["no", "yes"]:
+        matches = set(YES_NO_PATTERN.findall(llm_answer))
+        if len(matches) == 1:
+            return question_node.children[lowered_answers.index(matches.pop())]
+
+    # Fall back to semantic similarity. Options seen before reuse their
+    # embeddings, otherwise they're encoded in the same batch as the output
+    sentence_transformer = get_sentence_transformer()
+    if (answer_embeddings := _candidate_embeddings.get(candidate_answers)) is None:
+        embeddings = sentence_transformer.encode(
+            [llm_answer, *candidate_answers],
+            convert_to_tensor=True,
+            normalize_embeddings=True,
+        )
+        output_embedding, answer_embeddings = embeddings[:1], embeddings[1:]
+        if len(_candidate_embeddings) >= MAX_CACHED_CANDIDATE_EMBEDDINGS:
+            del _candidate_embeddings[next(iter(_candidate_embeddings))]
+        _candidate_embeddings[candidate_answers] = answer_embeddings
+    else:
+        output_embedding = sentence_transformer.encode(
+            [llm_answer], convert_to_tensor=True, normalize_embeddings=True
+        )
+    similarities = sentence_transformer.similarity(
         output_embedding, answer_embeddings
     ).squeeze(0)
     best_idx = int(similarities.argmax().item())
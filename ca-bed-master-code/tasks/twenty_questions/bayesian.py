@@ -5,18 +5,56 @@ from typing import override
 from models import (
     LLMRequestSession,
     get_response,
+    get_token_logprobs_for_messages,
     get_top_logprobs_for_messages,
 )
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.tree_task import (
+    ASSISTANT_PRIMER,
     TreeTask,
-    normalise_logprobs,
+    answer_probabilities,
+    format_answer_list,
+    is_answer_number,
     parse_answer,
     parse_binary_questions,
 )
 
+# Dedented once at import rather than on every request
+ANSWER_PROMPT_TEMPLATE = dedent("""\
+    You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {task_answer}.
+    I will ask up to 20 questions and you should answer each one truthfully based on being X.
+
+    ### Instructions
+    - Answer truthfully based on what X is.  
+    - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
+    - Do not add extra text or commentary. Return exactly one of the options.
+
+    ### Question
+    "{question}"
+    """).strip()
+QUESTION_PROMPT_PREFIX = dedent("""
+    You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating the secret entity, X.
+    You will ask me up to 20 questions which start with 'Is X' and can only be answered by 'Yes' or 'No', and I will answer each one truthfully based on being X.
+    """).strip()
+QUESTION_PROMPT_SUFFIX_TEMPLATE = dedent("""
+    Your task is to generate {max_question_nodes} *excellent* yes/no questions to ask next.
+    The best questions are those that will help distinguish between these likely possibilities.
+    Format your response in this structure:
+    1. <Question 1>
+    2. <Question 2>
+    ...
+    n. <Question n>
+    """).strip()
+
 
 class TwentyQuestionsBayesian(TreeTask):
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
+    # Number of items whose likelihoods are estimated in a single request
+    likelihood_batch_size: int
+
     def __init__(
         self,
         questioner_session: LLMRequestSession,
@@ -28,6 +66,7 @@ class TwentyQuestionsBayesian(TreeTask):
         estimator_confidence: float,
         confidence_threshold: float,
         hypothesis_space: list[str],
+        likelihood_batch_size: int = 1,
     ):
         super().__init__(
             questioner_session=questioner_session,
@@ -40,6 +79,12 @@ class TwentyQuestionsBayesian(TreeTask):
             confidence_threshold=confidence_threshold,
             hypothesis_space=hypothesis_space,
         )
+        self.likelihood_batch_size = likelihood_batch_size
+
+        self.question_prompt_prefix = QUESTION_PROMPT_PREFIX
+        self.question_prompt_suffix = QUESTION_PROMPT_SUFFIX_TEMPLATE.format(
+            max_question_nodes=self.max_question_nodes
+        )
 
     def __str__(self) -> str:
         return (
@@ -51,22 +96,15 @@ class TwentyQuestionsBayesian(TreeTask):
             f"{self.max_conversation_depth=} "
             f"{self.confidence_threshold=} "
             f"{self.estimator_confidence=} "
+            f"{self.likelihood_batch_size=} "
         )
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            entity: 1 / len(self.hypothesis_space) for entity in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
-        parts = []
-        parts.append(
-            dedent("""
-                You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating the secret entity, X.
-                You will ask me up to 20 questions which start with 'Is X' and can only be answered by 'Yes' or 'No', and I will answer each one truthfully based on being X.
-            """).strip()
-        )
+        parts = [self.question_prompt_prefix]
 
         reduced_hypotheses = "\n".join(
             f"- {item}" for item in current_node.belief_state.keys()
@@ -90,17 +128,7 @@ class TwentyQuestionsBayesian(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent(f"""
-                Your task is to generate {self.max_question_nodes} *excellent* yes/no questions to ask next.
-                The best questions are those that will help distinguish between these likely possibilities.
-                Format your response in this structure:
-                1. <Question 1>
-                2. <Question 2>
-                ...
-                n. <Question n>
-                """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
         return "\n\n".join(parts)
 
     @override
@@ -119,40 +147,51 @@ class TwentyQuestionsBayesian(TreeTask):
     async def get_likelihoods(
         self, question: str, answers: list[str], hypotheses: list[str]
     ) -> dict[str, dict[str, float]]:
-        tasks = []
-        for hypothesis_name in hypotheses:
-            if hypothesis_name not in self.hypothesis_space:
-                continue
+        items = [h for h in hypotheses if h in self.hypothesis_set]
+        # The same for every hypothesis, so only built once per question
+        answer_list_str = format_answer_list(answers)
+
+        if self.likelihood_batch_size > 1:
+            batches = await asyncio.gather(
+                *[
+                    self._get_likelihoods_for_items(
+                        items=items[start : start + self.likelihood_batch_size],
+                        question=question,
+                        target_answers=answers,
+                        answer_list_str=answer_list_str,
+                    )
+                    for start in range(0, len(items), self.likelihood_batch_size)
+                ]
+            )
+            return {item: probs for batch in batches for item, probs in batch.items()}
 
-            tasks.append(
+        results = await asyncio.gather(
+            *[
                 self._get_likelihood_for_one_item(
-                    item=hypothesis_name,
+                    item=item,
                     question=question,
                     target_answers=answers,
+                    answer_list_str=answer_list_str,
                 )
-            )
-
-        results = await asyncio.gather(*tasks)
+                for item in items
+            ]
+        )
         return {hypo_name: probs for hypo_name, probs in results}
 
     @override
     async def get_answer(self, current_node: QuestionNode) -> EvidenceNode:
-        prompt = dedent(f"""\
-            You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {self.task_answer}.
-            I will ask up to 20 questions and you should answer each one truthfully based on being X.
-
-            ### Instructions
-            - Answer truthfully based on what X is.  
-            - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
-            - Do not add extra text or commentary. Return exactly one of the options.
-
-            ### Question
-            "{current_node.question}"
-            """).strip()
+        prompt = ANSWER_PROMPT_TEMPLATE.format(
+            task_answer=self.task_answer, question=current_node.question
+        )
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            self.task_answer,
+            current_node.question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)
 
@@ -161,11 +200,8 @@ class TwentyQuestionsBayesian(TreeTask):
         item: str,
         question: str,
         target_answers: list[str],
+        answer_list_str: str,
     ) -> tuple[str, dict[str, float]]:
-        answer_list_str = "\n".join(
-            f"{idx}. {answer}" for idx, answer in enumerate(target_answers, start=1)
-        )
-
         user_prompt = dedent(f"""\
             You are playing a game of 20 Questions.
             ---
@@ -186,33 +222,79 @@ class TwentyQuestionsBayesian(TreeTask):
 
             The answer was number:""").strip()
 
-        messages_for_api = [
-            {"role": "user", "content": user_prompt},
-            {"role": "assistant", "content": " "},  # Force start token
-        ]
+        messages_for_api = [{"role": "user", "content": user_prompt}, ASSISTANT_PRIMER]
 
         top_logprobs_list = await get_top_logprobs_for_messages(
             messages_for_api, self.questioner_session
         )
+        return (item, answer_probabilities(top_logprobs_list, target_answers))
 
-        if not top_logprobs_list:
-            num_answers = len(target_answers)
-            return (
-                item,
-                {answer: 1.0 / num_answers for answer in target_answers},
+    async def _get_likelihoods_for_items(
+        self,
+        items: list[str],
+        question: str,
+        target_answers: list[str],
+        answer_list_str: str,
+    ) -> dict[str, dict[str, float]]:
+        """
+        Estimates the likelihoods for several items with one request, which
+        answers for each item in turn. Each answer is sampled, and conditions
+        the answers after it, so this is an approximation of the per-item
+        estimate that needs far fewer requests
+        """
+        if len(items) == 1:
+            item, probs = await self._get_likelihood_for_one_item(
+                items[0], question, target_answers, answer_list_str
             )
+            return {item: probs}
+
+        # Bulleted rather than numbered, so candidate numbers can't be mistaken
+        # for answer numbers
+        item_list_str = "\n".join(f"- {item}" for item in items)
 
-        logprob_lookup = {lp.token: lp.logprob for lp in top_logprobs_list}
+        user_prompt = dedent(f"""\
+            You are playing a game of 20 Questions.
+
+            ### Scenario
+            You asked the following question:
+            "{question}"
 
-        raw_logprobs = {}
-        for i, answer in enumerate(target_answers, start=1):
-            target_token_str = f"{i}"
-            logprob_with_space = logprob_lookup.get(
-                f" {target_token_str}", -float("inf")
+            ### Possible Answers
+            {answer_list_str}
+
+            ### Candidates
+            {item_list_str}
+
+            ### Task
+            Take each candidate in turn, assume it is the secret entity, and decide which answer the answerer gave.
+            Respond with the number for the answer only, one per line, in the same order as the candidates.""").strip()
+
+        messages_for_api = [{"role": "user", "content": user_prompt}, ASSISTANT_PRIMER]
+
+        # Each answer is a number then a line break
+        token_logprobs = await get_token_logprobs_for_messages(
+            messages_for_api, self.questioner_session, max_tokens=2 * len(items)
+        )
+        answer_positions = [
+            position.top_logprobs
+            for position in token_logprobs
+            if is_answer_number(position.token, len(target_answers))
+        ]
+
+        # Answers can only be matched to items by their order, so unless there is
+        # exactly one per item, fall back to one request per item for all of them
+        if len(answer_positions) != len(items):
+            results = await asyncio.gather(
+                *[
+                    self._get_likelihood_for_one_item(
+                        item, question, target_answers, answer_list_str
+                    )
+                    for item in items
+                ]
             )
-            logprob_without_space = logprob_lookup.get(target_token_str, -float("inf"))
-            logprob = max(logprob_with_space, logprob_without_space)
-            raw_logprobs[answer] = logprob
+            return dict(results)
 
-        normalised_probs = normalise_logprobs(raw_logprobs)
-        return (item, normalised_probs)
+        return {
+            item: answer_probabilities(top_logprobs_list, target_answers)
+            for item, top_logprobs_list in zip(items, answer_positions)
+        }
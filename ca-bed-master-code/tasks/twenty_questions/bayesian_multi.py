@@ -1,3 +1,4 @@
+import asyncio
 from textwrap import dedent
 from typing import override
 
@@ -7,15 +8,39 @@ from models import (
     get_top_logprobs_for_messages,
 )
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.tree_task import (
+    ASSISTANT_PRIMER,
     TreeTask,
-    normalise_logprobs,
+    answer_probabilities,
+    format_answer_list,
     parse_answer,
     parse_multi_questions,
 )
 
 
+# Dedented once at import rather than on every request
+ANSWER_PROMPT_TEMPLATE = dedent("""\
+    You are playing a game of 20 Questions. You must roleplay as the secret entity, X. X is {task_answer}.
+
+    ### Instructions
+    - Answer truthfully based on what X is.
+    - Respond using exactly one of the provided options. You must copy it verbatim.
+    - Do not add extra commentary or punctuation.
+
+    ### Question
+    "{question}"
+
+    ### Allowed Responses
+    {answer_list}
+    """).strip()
+
+
 class TwentyQuestionsBayesianWithMultibranching(TreeTask):
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
+
     def __init__(
         self,
         questioner_session: LLMRequestSession,
@@ -40,6 +65,30 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
             hypothesis_space=hypothesis_space,
         )
 
+        self.question_prompt_prefix = dedent(f"""\
+            You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating X.
+
+            You may ultimately ask up to {self.max_conversation_depth} questions during the full game, but right now your task is to propose the next {self.max_question_nodes} candidate questions.
+            """).strip()
+        self.question_prompt_suffix = dedent("""\
+            ### Task
+            Generate questions that help differentiate the remaining candidates. Each question must:
+            - Start with EXACTLY 'Is X' and be answerable truthfully about the secret entity.
+            - Provide a realistic set of possible answers for that question.
+            - Focus on attributes that meaningfully split the hypothesis space.
+
+            ### Response Format
+            Respond using one line per question in this EXACT structure:
+            1. Is X ... ?|Answer1|Answer2|Answer3
+            2. Is X ... ?|Answer1|Answer2
+            ...
+            n. Is X ... ?|Answer1|Answer2|Answer3|Answer4
+                   
+            ### Example
+            1. Is X a living being?|Yes|No
+            2. Is X commonly found indoors?|Yes|No|Sometimes
+            """).strip()
+
     def __str__(self) -> str:
         return (
             "Twenty Questions (Bayesian + Multibranching): "
@@ -54,9 +103,7 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            entity: 1 / len(self.hypothesis_space) for entity in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
         remaining_hypotheses = "\n".join(
@@ -64,13 +111,7 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
         )
 
         parts: list[str] = []
-        parts.append(
-            dedent(f"""\
-            You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating X.
-
-            You may ultimately ask up to {self.max_conversation_depth} questions during the full game, but right now your task is to propose the next {self.max_question_nodes} candidate questions.
-            """).strip()
-        )
+        parts.append(self.question_prompt_prefix)
 
         parts.append(
             dedent(f"""\
@@ -91,26 +132,7 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent("""\
-            ### Task
-            Generate questions that help differentiate the remaining candidates. Each question must:
-            - Start with EXACTLY 'Is X' and be answerable truthfully about the secret entity.
-            - Provide a realistic set of possible answers for that question.
-            - Focus on attributes that meaningfully split the hypothesis space.
-
-            ### Response Format
-            Respond using one line per question in this EXACT structure:
-            1. Is X ... ?|Answer1|Answer2|Answer3
-            2. Is X ... ?|Answer1|Answer2
-            ...
-            n. Is X ... ?|Answer1|Answer2|Answer3|Answer4
-                   
-            ### Example
-            1. Is X a living being?|Yes|No
-            2. Is X commonly found indoors?|Yes|No|Sometimes
-            """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
 
         return "\n\n".join(parts)
 
@@ -130,43 +152,42 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
     async def get_likelihoods(
         self, question: str, answers: list[str], hypotheses: list[str]
     ) -> dict[str, dict[str, float]]:
-        likelihoods = {}
-        for hypothesis_name in hypotheses:
-            if hypothesis_name not in self.hypothesis_space:
-                continue
-
-            item, probs = await self._get_likelihood_for_one_item(
-                item=hypothesis_name,
-                question=question,
-                target_answers=answers,
-            )
-            likelihoods[item] = probs
-
-        return likelihoods
+        # The same for every hypothesis, so only built once per question
+        answer_list_str = format_answer_list(answers)
+
+        results = await asyncio.gather(
+            *[
+                self._get_likelihood_for_one_item(
+                    item=hypothesis_name,
+                    question=question,
+                    target_answers=answers,
+                    answer_list_str=answer_list_str,
+                )
+                for hypothesis_name in hypotheses
+                if hypothesis_name in self.hypothesis_set
+            ]
+        )
+        return {item: probs for item, probs in results}
 
     @override
     async def get_answer(self, current_node: QuestionNode) -> EvidenceNode:
         answer_options = [child.answer for child in current_node.children]
         answer_list = ", ".join(answer_options)
 
-        prompt = dedent(f"""\
-            You are playing a game of 20 Questions. You must roleplay as the secret entity, X. X is {self.task_answer}.
-
-            ### Instructions
-            - Answer truthfully based on what X is.
-            - Respond using exactly one of the provided options. You must copy it verbatim.
-            - Do not add extra commentary or punctuation.
-
-            ### Question
-            "{current_node.question}"
-
-            ### Allowed Responses
-            {answer_list}
-            """).strip()
+        prompt = ANSWER_PROMPT_TEMPLATE.format(
+            task_answer=self.task_answer,
+            question=current_node.question,
+            answer_list=answer_list,
+        )
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            f"{self.task_answer}: {answer_list}",
+            current_node.question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)
 
@@ -175,11 +196,8 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
         item: str,
         question: str,
         target_answers: list[str],
+        answer_list_str: str,
     ) -> tuple[str, dict[str, float]]:
-        answer_list_str = "\n".join(
-            f"{idx}. {answer}" for idx, answer in enumerate(target_answers, start=1)
-        )
-
         user_prompt = dedent(f"""\
             You are analysing a game of 20 Questions.
             ---
@@ -200,33 +218,10 @@ class TwentyQuestionsBayesianWithMultibranching(TreeTask):
 
             The answer was number:""").strip()
 
-        messages_for_api = [
-            {"role": "user", "content": user_prompt},
-            {"role": "assistant", "content": " "},  # Encourage the model to emit tokens
-        ]
+        messages_for_api = [{"role": "user", "content": user_prompt}, ASSISTANT_PRIMER]
 
         top_logprobs_list = await get_top_logprobs_for_messages(
             messages_for_api, self.questioner_session
         )
 
-        if not top_logprobs_list:
-            num_answers = len(target_answers)
-            return (
-                item,
-                {answer: 1.0 / num_answers for answer in target_answers},
-            )
-
-        logprob_lookup = {lp.token: lp.logprob for lp in top_logprobs_list}
-
-        raw_logprobs = {}
-        for i, answer in enumerate(target_answers, start=1):
-            target_token_str = f"{i}"
-            logprob_with_space = logprob_lookup.get(
-                f" {target_token_str}", -float("inf")
-            )
-            logprob_without_space = logprob_lookup.get(target_token_str, -float("inf"))
-            logprob = max(logprob_with_space, logprob_without_space)
-            raw_logprobs[answer] = logprob
-
-        normalised_probs = normalise_logprobs(raw_logprobs)
-        return (item, normalised_probs)
+        return (item, answer_probabilities(top_logprobs_list, target_answers))
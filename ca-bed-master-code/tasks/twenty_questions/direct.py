@@ -1,17 +1,37 @@
-import re
 from textwrap import dedent
 from typing import override
 
 from models import LLMRequestSession, get_response
-from node import EvidenceNode, get_conversation_history
+from node import EvidenceNode, get_conversation_depth, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.direct_prompting_task import (
+    PREDICTION_RESPONSE_PATTERN,
+    QUESTION_RESPONSE_PATTERN,
     DirectPromptingTask,
     Prediction,
     Question,
 )
 
+TARGETTING_PROMPT = "Now you should make predicitions instead of asking questions"
+# Dedented once at import rather than on every request
+ANSWER_PROMPT_TEMPLATE = dedent("""\
+    You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {task_answer}.
+    I will ask up to 20 questions and you should answer each one truthfully based on being X.
+
+    ### Instructions
+    - Answer truthfully based on what X is.
+    - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
+    - Do not add extra text or commentary. Return exactly one of the options.
+
+    ### Question
+    "{question}"
+    """).strip()
+
 
 class TwentyQuestionsDirect(DirectPromptingTask):
+    # Part of the question prompt that doesn't change between turns
+    question_prompt_prefix: str
+
     def __init__(
         self,
         questioner_session: LLMRequestSession,
@@ -28,19 +48,9 @@ class TwentyQuestionsDirect(DirectPromptingTask):
             hypothesis_space=hypothesis_space,
         )
 
-    def __str__(self) -> str:
-        return f"Twenty Questions (Direct): {self.task_answer=} {self.max_conversation_depth=} {self.hypothesis_space=}"
-
-    @override
-    async def query_questioner(
-        self, current_node: EvidenceNode
-    ) -> Question | Prediction:
-        parts = []
-
-        # Prologue
+        # The prologue only depends on the hypothesis space, so it is built once
         possible_items = "\n".join(f"- {h}" for h in self.hypothesis_space)
-        parts.append(
-            dedent(f"""\
+        self.question_prompt_prefix = dedent(f"""\
             You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating the secret entity, X.
             The secret entity could be one of the following:
             {possible_items}
@@ -52,10 +62,16 @@ class TwentyQuestionsDirect(DirectPromptingTask):
 
             Otherwise, if you need more information, output:
             [QUESTION]: <Your yes/no question here>
-            """)
-            .format(possible_items=possible_items)
-            .strip()
-        )
+            """).strip()
+
+    def __str__(self) -> str:
+        return f"Twenty Questions (Direct): {self.task_answer=} {self.max_conversation_depth=} {self.hypothesis_space=}"
+
+    @override
+    async def query_questioner(
+        self, current_node: EvidenceNode
+    ) -> Question | Prediction:
+        parts = [self.question_prompt_prefix]
 
         # Conversation history
         history = get_conversation_history(current_node)
@@ -69,12 +85,8 @@ class TwentyQuestionsDirect(DirectPromptingTask):
             )
 
         # Targetting prompt
-        if len(history) >= self.max_conversation_depth - 3:
-            parts.append(
-                dedent("""
-                Now you should make predicitions instead of asking questions
-                """).strip()
-            )
+        if get_conversation_depth(current_node) >= self.max_conversation_depth - 3:
+            parts.append(TARGETTING_PROMPT)
 
         # Query LLM
         prompt = "\n\n".join(parts)
@@ -84,34 +96,27 @@ class TwentyQuestionsDirect(DirectPromptingTask):
         )
 
         # Parse LLM
-        question_match = re.search(r"\[QUESTION\]:\s*(.*)", output, re.IGNORECASE)
-        prediction_match = re.search(
-            r"\[(PREDICTION|ANSWER|PREDECTION)\]:\s*(.*)", output, re.IGNORECASE
-        )
-
-        if question_match:
+        # A question wins over a prediction in the same response, so only look
+        # for a prediction once there's no question
+        if question_match := QUESTION_RESPONSE_PATTERN.search(output):
             return Question(question_match.group(1).strip())
-        elif prediction_match:
-            return Prediction(prediction_match.group(2).strip())
+        elif prediction_match := PREDICTION_RESPONSE_PATTERN.search(output):
+            return Prediction(prediction_match.group(1).strip())
         else:
             raise RuntimeError(f"Response does not match expected structure, {output}")
 
     @override
     async def query_answerer(self, question: str) -> str:
-        prompt = dedent(f"""\
-            You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {self.task_answer}.
-            I will ask up to 20 questions and you should answer each one truthfully based on being X.
-
-            ### Instructions
-            - Answer truthfully based on what X is.
-            - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
-            - Do not add extra text or commentary. Return exactly one of the options.
-
-            ### Question
-            "{question}"
-            """).strip()
+        prompt = ANSWER_PROMPT_TEMPLATE.format(
+            task_answer=self.task_answer, question=question
+        )
 
-        return await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        return await get_cached_answer(
+            self.semantic_cache,
+            self.task_answer,
+            question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
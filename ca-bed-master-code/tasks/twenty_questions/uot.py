@@ -3,6 +3,7 @@ from typing import override
 
 from models import LLMRequestSession, get_response
 from node import EvidenceNode, QuestionNode, get_conversation_history
+from semantic_cache import get_cached_answer
 from tasks.tree_task import (
     TreeTask,
     parse_answer,
@@ -10,8 +11,26 @@ from tasks.tree_task import (
     parse_categorical_likelihoods,
 )
 
+# Dedented once at import rather than on every request
+ANSWER_PROMPT_TEMPLATE = dedent("""\
+    You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {task_answer}.
+    I will ask up to 20 questions and you should answer each one truthfully based on being X.
+
+    ### Instructions
+    - Answer truthfully based on what X is.  
+    - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
+    - Do not add extra text or commentary. Return exactly one of the options.
+
+    ### Question
+    "{question}"
+    """).strip()
+
 
 class TwentyQuestionsUoT(TreeTask):
+    # Parts of the question prompt that don't change between turns
+    question_prompt_prefix: str
+    question_prompt_suffix: str
+
     def __init__(
         self,
         questioner_session: LLMRequestSession,
@@ -36,6 +55,20 @@ class TwentyQuestionsUoT(TreeTask):
             estimator_confidence=estimator_confidence,
         )
 
+        self.question_prompt_prefix = dedent("""
+            You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating the secret entity, X.
+            You will ask me up to 20 questions which start with 'Is X' and can only be answered by 'Yes' or 'No', and I will answer each one truthfully based on being X.
+        """).strip()
+        self.question_prompt_suffix = dedent(f"""
+            Your task is to generate {self.max_question_nodes} *excellent* yes/no questions to ask next.
+            The best questions are those that will help distinguish between these likely possibilities.
+            Format your response in this structure:
+            1. <Question 1>
+            2. <Question 2>
+            ...
+            n. <Question n>
+            """).strip()
+
     def __str__(self) -> str:
         return (
             "Twenty Questions (UoT): "
@@ -50,18 +83,10 @@ class TwentyQuestionsUoT(TreeTask):
 
     @override
     async def create_initial_belief_state(self) -> dict[str, float]:
-        return {
-            entity: 1 / len(self.hypothesis_space) for entity in self.hypothesis_space
-        }
+        return dict.fromkeys(self.hypothesis_space, 1 / len(self.hypothesis_space))
 
     def _build_question_prompt(self, current_node: EvidenceNode) -> str:
-        parts = []
-        parts.append(
-            dedent("""
-                You are an expert player of the 20 Questions game. Your goal is to guess a secret entity, X. I will be impersonating the secret entity, X.
-                You will ask me up to 20 questions which start with 'Is X' and can only be answered by 'Yes' or 'No', and I will answer each one truthfully based on being X.
-            """).strip()
-        )
+        parts = [self.question_prompt_prefix]
 
         reduced_hypotheses = "\n".join(
             f"- {item}" for item in current_node.belief_state.keys()
@@ -85,17 +110,7 @@ class TwentyQuestionsUoT(TreeTask):
                 """).strip()
             )
 
-        parts.append(
-            dedent(f"""
-                Your task is to generate {self.max_question_nodes} *excellent* yes/no questions to ask next.
-                The best questions are those that will help distinguish between these likely possibilities.
-                Format your response in this structure:
-                1. <Question 1>
-                2. <Question 2>
-                ...
-                n. <Question n>
-                """).strip()
-        )
+        parts.append(self.question_prompt_suffix)
         return "\n\n".join(parts)
 
     @override
@@ -150,31 +165,26 @@ class TwentyQuestionsUoT(TreeTask):
             session=self.questioner_session,
         )
         likelihoods = parse_categorical_likelihoods(output, possible_answers=answers)
+        # The parser builds every vector from the answers themselves, so their
+        # lengths always match
         return {
-            likelihood.hypothesis: {
-                ans: prob
-                for ans, prob in zip(answers, likelihood.likelihoods, strict=True)
-            }
+            likelihood.hypothesis: dict(zip(answers, likelihood.likelihoods))
             for likelihood in likelihoods
         }
 
     @override
     async def get_answer(self, current_node: QuestionNode) -> EvidenceNode:
-        prompt = dedent(f"""\
-            You are a player of the 20 Questions game. Your goal is to impersonate the secret entity, X. X is {self.task_answer}.
-            I will ask up to 20 questions and you should answer each one truthfully based on being X.
-
-            ### Instructions
-            - Answer truthfully based on what X is.  
-            - You must ONLY respond with either 'Yes' or 'No', matching it EXACTLY.
-            - Do not add extra text or commentary. Return exactly one of the options.
-
-            ### Question
-            "{current_node.question}"
-            """).strip()
+        prompt = ANSWER_PROMPT_TEMPLATE.format(
+            task_answer=self.task_answer, question=current_node.question
+        )
 
-        output = await get_response(
-            messages=[{"role": "user", "content": prompt}],
-            session=self.answerer_session,
+        output = await get_cached_answer(
+            self.semantic_cache,
+            self.task_answer,
+            current_node.question,
+            lambda: get_response(
+                messages=[{"role": "user", "content": prompt}],
+                session=self.answerer_session,
+            ),
         )
         return parse_answer(output, current_node)